@@ -1,9 +1,11 @@
 from abc import ABC, abstractmethod
-import numpy as np
-from collections import UserDict, UserList
-from intervaltree import Interval, IntervalTree
-from decimal import Decimal
+import bisect
+from functools import cached_property, partial
+from itertools import chain
+from operator import attrgetter
+from intervaltree import Interval
 from gcr import entities
+from gcr.entities import COORD
 
 
 class BaseContainer(entities.WireAllocatables, ABC):
@@ -20,46 +22,50 @@ class BaseContainer(entities.WireAllocatables, ABC):
         _type_: _description_
     """
 
+    # NOTE: コンテナは構築後に変更しない前提で, 幾何情報は初回アクセス時の値を使い回す.
+
     @property
     @abstractmethod
     def total_netlist(self) -> list[entities.Allocatables]:
         pass
 
-    def total_width(self, nl: list[entities.Allocatables]) -> Decimal:
-        total = 0
-        total += sum([n.width for n in nl])
-        for i in range(len(nl) - 1):
-            total += max(nl[i].upper_space, nl[i + 1].lower_space)
+    def total_width(self, nl: list[entities.Allocatables]) -> COORD:
+        total = sum(n.width for n in nl)
+        # 隣接する要素間のスペースは大きい方を採用
+        total += sum(
+            max(lower.upper_space, upper.lower_space)
+            for lower, upper in zip(nl, nl[1:])
+        )
         return total
 
-    @property
+    @cached_property
     def width(self):
         w = self.total_width(self.total_netlist)
         return w
 
-    @property
-    def width_with_space(self) -> Decimal:
+    @cached_property
+    def width_with_space(self) -> COORD:
         wws = self.width + self.upper_space + self.lower_space
         return wws
 
-    @property
-    def upper_space(self) -> Decimal:
+    @cached_property
+    def upper_space(self) -> COORD:
         return self.total_netlist[-1].upper_space
 
-    @property
-    def lower_space(self) -> Decimal:
+    @cached_property
+    def lower_space(self) -> COORD:
         return self.total_netlist[0].lower_space
 
     @property
     def pins(self) -> list[entities.Pin]:
-        _pins = []
-        for n in self.total_netlist:
-            if isinstance(n, entities.Net):
-                _pins += n.pins
-        return _pins
+        return list(
+            chain.from_iterable(
+                n.pins for n in self.total_netlist if isinstance(n, entities.Net)
+            )
+        )
 
 
-class ShieldedNetList(UserList, BaseContainer):
+class ShieldedNetList(list, BaseContainer):
     """
     以下使用条件
     - 互いがx軸において重なるネットリスト
@@ -71,8 +77,8 @@ class ShieldedNetList(UserList, BaseContainer):
 
     """
 
-    def __init__(self, netlist: list, x_interval: Interval, shield_width: Decimal):
-        self.data = []
+    def __init__(self, netlist: list, x_interval: Interval, shield_width: COORD):
+        super().__init__()
         if netlist == []:
             return
 
@@ -90,8 +96,8 @@ class ShieldedNetList(UserList, BaseContainer):
         self._is_group_net = self.shield_type.is_group_shield()
         # build
         if not n.require_shield():
-            self.data = netlist
-        elif self.shield_type.is_group_shield():
+            self.extend(netlist)
+        elif self._is_group_net:
             self.__build_netlist_with_group_shield(netlist)
         else:
             self.__build_netlist_with_shield(netlist)
@@ -107,45 +113,46 @@ class ShieldedNetList(UserList, BaseContainer):
         # ), "Support only 1 unique space..."
 
         # 現時点ではshield typeは一つのみ.
-        assert (
-            len(np.unique([n.shield_type for n in netlist])) == 1
+        first = netlist[0].shield_type
+        assert all(
+            n.shield_type == first for n in netlist
         ), "Support only 1 unique shield type..."
 
         pass
 
     def __build_netlist_with_shield(self, netlist: list):
-        # add normal shield
-        for i, n in enumerate(netlist):
-            if i == 0:
-                space = netlist[0].lower_space
-            else:
-                space = max(netlist[i - 1].upper_space, netlist[i].lower_space)
-
-            iv_begin = max(netlist[i - 1].x_interval.begin, netlist[i].x_interval.begin)
-            iv_end = max(netlist[i - 1].x_interval.end, netlist[i].x_interval.end)
-
-            s = entities.Shield(
-                f"{self.group_name}-shield",
-                self.shield_type,
-                self.layer,
-                iv_begin,
-                iv_end,
-                self.shield_width,
-                space,
-            )
-            self.data.append(s)
-            self.data.append(n)
-
-        s = entities.Shield(
+        # NOTE: 名前などシールド間で共通の引数は一度だけ用意する
+        new_shield = partial(
+            entities.Shield,
             f"{self.group_name}-shield",
             self.shield_type,
             self.layer,
-            netlist[-1].x_interval.begin,
-            netlist[-1].x_interval.end,
-            self.shield_width,
-            netlist[-1].upper_space,
         )
-        self.data.append(s)
+        shield_width = self.shield_width
+
+        # add normal shield
+        # NOTE: 先頭のシールドの区間は, 末尾のネットとの比較で決まる
+        data = []
+        prev = netlist[-1]
+        space = netlist[0].lower_space
+        for i, n in enumerate(netlist):
+            if i > 0:
+                space = max(prev.upper_space, n.lower_space)
+            prev_iv = prev.x_interval
+            n_iv = n.x_interval
+            iv_begin = max(prev_iv.begin, n_iv.begin)
+            iv_end = max(prev_iv.end, n_iv.end)
+            data.append(new_shield(iv_begin, iv_end, shield_width, space))
+            data.append(n)
+            prev = n
+
+        last_iv = netlist[-1].x_interval
+        data.append(
+            new_shield(
+                last_iv.begin, last_iv.end, shield_width, netlist[-1].upper_space
+            )
+        )
+        self.extend(data)
 
     def __build_netlist_with_group_shield(self, netlist: list):
         s_bottom = entities.Shield(
@@ -166,7 +173,9 @@ class ShieldedNetList(UserList, BaseContainer):
             self.shield_width,
             netlist[-1].upper_space,
         )
-        self.data = [s_bottom] + netlist + [s_top]
+        self.append(s_bottom)
+        self.extend(netlist)
+        self.append(s_top)
 
     @property
     def x_interval(self) -> Interval:
@@ -176,44 +185,35 @@ class ShieldedNetList(UserList, BaseContainer):
     def total_netlist(self) -> list[entities.Allocatables]:
         # TODO: 配線順序を最適化
         # e.g., spaceが大きいもの同士を隣接させる
-        return self.data
+        return self
 
     def __add__(self, other):
-        if isinstance(other, ShieldedNetList):
-            return self.data + other.data
-        elif isinstance(other, list):
-            return self.data + other
+        if isinstance(other, list):
+            return list.__add__(self, other)
         else:
             raise ValueError
 
     def __radd__(self, other):
-        if isinstance(other, ShieldedNetList):
-            return self.data + other.data
-        elif isinstance(other, list):
-            return self.data + other
+        if isinstance(other, list):
+            return list.__add__(self, other)
         else:
             raise ValueError
 
-    def __getitem__(self, index):
-        if isinstance(index, slice):
-            return self.data[index]
-        return super().__getitem__(index)
 
-
-class ShieldDict(UserDict, BaseContainer):
+class ShieldDict(dict, BaseContainer):
     """
 
     Args:
-        UserDict (_type_): _description_
+        dict (_type_): _description_
         BaseContainer (_type_): _description_
     """
 
-    def __init__(self, netlist: list, x_interval: Interval, shield_width: Decimal):
+    def __init__(self, netlist: list, x_interval: Interval, shield_width: COORD):
         super().__init__()
         self._x_interval = x_interval
         shield_group = self.divide_netlist_by_shield_type(netlist)
         for shield_type, nl in shield_group.items():
-            self.data[shield_type] = ShieldedNetList(nl, x_interval, shield_width)
+            self[shield_type] = ShieldedNetList(nl, x_interval, shield_width)
 
     def divide_netlist_by_shield_type(self, nl: list) -> dict:
         grouping = {}
@@ -227,29 +227,29 @@ class ShieldDict(UserDict, BaseContainer):
     def x_interval(self) -> Interval:
         return self._x_interval
 
-    @property
+    @cached_property
     def total_netlist(self) -> list[entities.Allocatables]:
         # NOTE & TODO: 配置順序で結合する
         # 現状, 何も考えていない.
-        total_nl = []
-        for nl in self.data.values():
-            total_nl += nl
-        return total_nl
+        return list(chain.from_iterable(self.values()))
 
 
-class OverlappedIntervalDict(UserDict, BaseContainer):
+class OverlappedIntervalDict(dict, BaseContainer):
     """_summary_
 
     Args:
-        UserDict (_type_): _description_
+        dict (_type_): _description_
         BaseContainer (_type_): _description_
     """
 
-    def __init__(self, net_group_name: str, netlist: list, shield_width: Decimal):
+    def __init__(self, net_group_name: str, netlist: list, shield_width: COORD):
         super().__init__()
         self.name = net_group_name
+        self.shield_width = shield_width
         # self.dist_priority = 0
         # self.layer = netlist[0].layer
+        # NOTE: ネットの追加時に入力順のネットを参照するため保持しておく
+        self._netlist = list(netlist)
         nldict_by_same_interval = self.grouping_by_same_interval(netlist)
         distinct_intervals = list(nldict_by_same_interval.keys())
         merged_intervals = self.merge_intervals(distinct_intervals)
@@ -259,105 +259,147 @@ class OverlappedIntervalDict(UserDict, BaseContainer):
         for merged_iv in merged_intervals:
             overlapped_nl_dict[merged_iv] = []
         # collect netlist
-        for iv, nl in nldict_by_same_interval.items():
-            for merged_iv in merged_intervals:
-                if merged_iv.overlaps(iv):
-                    overlapped_nl_dict[merged_iv] += nl
-                    break
+        # NOTE: マージ後の区間は互いに素でbegin順のため, 各区間を含むものは二分探索で求まる.
+        # 同じ区間のネットをまとめると並び順が変わり幅が変わるため, 入力順のまま振り分ける
+        merged_begins = [merged_iv.begin for merged_iv in merged_intervals]
+        for n in netlist:
+            i = bisect.bisect_right(merged_begins, n.x_interval.begin) - 1
+            overlapped_nl_dict[merged_intervals[i]].append(n)
 
         # each netlist is stored via snld
         for x_interval, nl in overlapped_nl_dict.items():
             snld = ShieldDict(nl, x_interval, shield_width)
-            self.data[x_interval] = snld
+            self[x_interval] = snld
+
+    def add(self, net: entities.Net) -> None:
+        """ネットを一つ追加する
+
+        追加するネットと重なる区間のみをマージし, そのShieldDictを再構築する.
+
+        Args:
+            net (entities.Net): 追加するネット
+        """
+        self._netlist.append(net)
+
+        # 追加するネットと重なる区間をまとめる
+        x_iv = net.x_interval
+        begin, end = x_iv.begin, x_iv.end
+        for merged_iv in [iv for iv in self if iv.begin < end and begin < iv.end]:
+            begin = min(begin, merged_iv.begin)
+            end = max(end, merged_iv.end)
+            del self[merged_iv]
+
+        # マージ後の区間に含まれるネットを, 構築時と同じ順序で集める
+        merged_iv = Interval(begin, end)
+        nl = [
+            n
+            for n in self._netlist
+            if begin <= n.x_interval.begin and n.x_interval.end <= end
+        ]
+        self[merged_iv] = ShieldDict(nl, merged_iv, self.shield_width)
+
+        # begin順に並べ直す
+        items = sorted(self.items(), key=lambda item: item[0].begin)
+        self.clear()
+        self.update(items)
+        self.__clear_cached_properties()
+
+    def __clear_cached_properties(self) -> None:
+        for cls in type(self).__mro__:
+            for name, attr in vars(cls).items():
+                if isinstance(attr, cached_property):
+                    self.__dict__.pop(name, None)
 
     def grouping_by_same_interval(self, netlist: list) -> dict:
+        # NOTE: x_intervalはdataにネット自身を持つため, 区間の端点のみをキーにする.
+        # マージする区間の重複除去にのみ使い, ネットの並び順には影響させない
         d = {}
         for n in netlist:
-            if not n.x_interval in d:
-                d[n.x_interval] = []
-            d[n.x_interval].append(n)
-        return d
+            x_iv = n.x_interval
+            key = (x_iv.begin, x_iv.end)
+            if not key in d:
+                d[key] = []
+            d[key].append(n)
+        return {Interval(begin, end): nl for (begin, end), nl in d.items()}
 
     def merge_intervals(self, ivs: list[Interval]) -> list[Interval]:
         if not ivs:
             return []
 
         merged = []
-        ivs.sort(key=lambda z: z.begin)
+        ivs.sort(key=attrgetter("begin"))
+        # NOTE: マージ中はbegin, endのみ更新し, Intervalは確定時に一度だけ生成する
         current_iv = ivs[0]
+        begin, end = current_iv.begin, current_iv.end
         for iv in ivs[1:]:
-            if current_iv.overlaps(iv):
-                current_iv = Interval(current_iv.begin, max(current_iv.end, iv.end))
+            if begin < iv.end and iv.begin < end:
+                end = max(end, iv.end)
+                current_iv = None
                 continue
 
-            merged.append(current_iv)
+            merged.append(current_iv or Interval(begin, end))
             current_iv = iv
+            begin, end = iv.begin, iv.end
 
-        merged.append(current_iv)
+        merged.append(current_iv or Interval(begin, end))
         return merged
 
-    @property
+    @cached_property
     def x_interval(self) -> Interval:
-        ivt = IntervalTree([n.x_interval for n in self.total_netlist])
-        return Interval(ivt.begin(), ivt.end())
+        ivs = [n.x_interval for n in self.total_netlist]
+        return Interval(min(iv.begin for iv in ivs), max(iv.end for iv in ivs))
 
-    @property
+    @cached_property
     def total_netlist(self):
         # NOTE: 合計pin-listや配線長でのみ使用
-        total_nl = []
-        for snld in self.data.values():
-            total_nl += snld.total_netlist
-        return total_nl
+        return list(chain.from_iterable(snld.total_netlist for snld in self.values()))
 
-    @property
-    def width(self) -> Decimal:
-        w = max([v.width for v in self.data.values()])
+    @cached_property
+    def width(self) -> COORD:
+        w = max(v.width for v in self.values())
         return w
 
-    @property
-    def width_with_space(self) -> Decimal:
-        wws = max([v.width_with_space for v in self.data.values()])
+    @cached_property
+    def width_with_space(self) -> COORD:
+        wws = max(v.width_with_space for v in self.values())
         return wws
 
-    @property
-    def upper_space(self) -> Decimal:
-        if len(self.data) > 1:
-            return (self.width_with_space - self.width) / 2
+    @cached_property
+    def upper_space(self) -> COORD:
+        if len(self) > 1:
+            return (self.width_with_space - self.width) // 2
         return self.total_netlist[-1].upper_space
 
-    @property
-    def lower_space(self) -> Decimal:
-        if len(self.data) > 1:
-            return (self.width_with_space - self.width) / 2
+    @cached_property
+    def lower_space(self) -> COORD:
+        if len(self) > 1:
+            return (self.width_with_space - self.width) // 2
         return self.total_netlist[0].lower_space
 
 
-class Bundle(UserList, BaseContainer):
+class Bundle(list, BaseContainer):
     """事前配線ネットリストを束ねるクラス
 
     Args:
-        UserList (_type_): _description_
+        list (_type_): _description_
         BaseContainer (_type_): _description_
     """
 
     def __init__(self, net_group_name: str, oids: list[OverlappedIntervalDict]):
+        super().__init__(oids)
         self.name = net_group_name
-        self.data = oids
 
-    @property
+    @cached_property
     def total_netlist(self) -> list[entities.Allocatables]:
-        total_nl = []
-        for d in self.data:
-            total_nl += d.total_netlist
-        return total_nl
+        return list(chain.from_iterable(d.total_netlist for d in self))
 
     @property
     def x_interval(self) -> Interval:
         raise NotImplementedError
 
-    def vertical_wirelength_with_multi_y(self, heights: list[Decimal] = None):
-        assert len(heights) == len(self.data)
-        total_vwl = Decimal("0")
-        for h, ig in zip(heights, self.data):
+    def vertical_wirelength_with_multi_y(self, heights: list[COORD] = None):
+        assert len(heights) == len(self)
+        total_vwl = 0
+        for h, ig in zip(heights, self):
             total_vwl += ig.vertical_wirelength(h)
         return total_vwl
@@ -1,40 +1,70 @@
 from __future__ import annotations
-from enum import Enum
 from decimal import Decimal
 from abc import ABC, abstractmethod
+from bisect import bisect_left
 from dataclasses import dataclass
+from functools import cache, cached_property
+from itertools import accumulate
+import numpy as np
 from intervaltree import Interval
 
 
-class SpaceType(Enum):
-    ABOVE = 1
-    BELOW = 2
+# NOTE: 座標・幅は入力単位の 1/COORD_SCALE を 1 とする整数(固定小数点)で保持する.
+# Decimalは入出力の境界でのみ使用する.
+COORD = int
+# NOTE: 入力は小数点以下9桁までを想定
+COORD_SCALE = 10**9
+# NOTE: 出力時は入力の表記(小数点以下2桁)に合わせ, 少なくともこの桁数まで0埋めする
+OUTPUT_MIN_PLACES = 2
+_OUTPUT_QUANTUM = Decimal(1).scaleb(-OUTPUT_MIN_PLACES)
 
 
-@dataclass(frozen=True, order=True)
-class Space:
-    type: SpaceType
-    y_min: Decimal
-    y_max: Decimal
+# NOTE: 入力ファイルには同じ数値文字列が繰り返し現れるため, 変換結果を使い回す
+@cache
+def to_coord(value: str | Decimal | int) -> COORD:
+    """入力値を固定小数点の整数座標に変換する.
 
-    def dict(self) -> dict:
-        return dict(x=str(self.x), y=str(self.y))
+    Args:
+        value (str | Decimal | int): 入力値
 
-    @property
-    def y_interval(self) -> Interval:
-        return Interval(self.y_min, self.y_max, self)
+    Raises:
+        ValueError: COORD_SCALEで表現できない精度の値が与えられた場合
+
+    Returns:
+        COORD: 整数座標
+    """
+    scaled = Decimal(value) * COORD_SCALE
+    coord = int(scaled)
+    if coord != scaled:
+        raise ValueError(f"Too fine coordinate is given: {value}")
+    return coord
+
+
+def to_decimal(coord: COORD) -> Decimal:
+    """整数座標を出力用のDecimalに変換する.
+
+    Args:
+        coord (COORD): 整数座標
 
+    Returns:
+        Decimal: 入力単位の値. 小数点以下は少なくともOUTPUT_MIN_PLACES桁で表記される
+    """
+    value = (Decimal(coord) / COORD_SCALE).normalize()
+    if value.as_tuple().exponent > -OUTPUT_MIN_PLACES:
+        value = value.quantize(_OUTPUT_QUANTUM)
+    return value
 
-@dataclass(frozen=True, order=True)
+
+@dataclass(frozen=True, order=True, slots=True)
 class Pin:
-    x: Decimal
-    y: Decimal
+    x: COORD
+    y: COORD
 
     def __repr__(self) -> str:
-        return f"Pin: ({self.x}, {self.y})"
+        return f"Pin: ({to_decimal(self.x)}, {to_decimal(self.y)})"
 
     def dict(self) -> dict:
-        return dict(x=str(self.x), y=str(self.y))
+        return dict(x=str(to_decimal(self.x)), y=str(to_decimal(self.y)))
 
 
 # NOTE: 不要？
@@ -45,6 +75,8 @@ class ReservedArea:
 
 
 class Allocatables(ABC):
+    __slots__ = ()
+
     @property
     @abstractmethod
     def x_interval(self):
@@ -67,12 +99,14 @@ class Allocatables(ABC):
 
 
 class Blockage(Allocatables):
+    __slots__ = ("x_min", "x_max", "y_min", "y_max", "_x_interval", "_y_interval")
+
     def __init__(
         self,
-        x_min: Decimal,
-        x_max: Decimal,
-        y_min: Decimal,
-        y_max: Decimal,
+        x_min: COORD,
+        x_max: COORD,
+        y_min: COORD,
+        y_max: COORD,
     ):
         self.x_min = x_min
         self.x_max = x_max
@@ -90,49 +124,68 @@ class Blockage(Allocatables):
         return self._y_interval
 
     @property
-    def width(self) -> Decimal:
+    def width(self) -> COORD:
         return self.y_max - self.y_min
 
     @property
-    def upper_space(self) -> Decimal:
-        return Decimal("0.0")
+    def upper_space(self) -> COORD:
+        return 0
 
     @property
-    def lower_space(self) -> Decimal:
-        return Decimal("0.0")
+    def lower_space(self) -> COORD:
+        return 0
 
     def __repr__(self):
         return (
-            f"Blockage: Ix[{self.x_min}, {self.x_max}] Iy[{self.y_min}, {self.y_max}]"
+            f"Blockage: Ix[{to_decimal(self.x_min)}, {to_decimal(self.x_max)}] "
+            f"Iy[{to_decimal(self.y_min)}, {to_decimal(self.y_max)}]"
         )
 
 
 class ShieldType(str):
     """Manage the classification around shield types."""
 
-    def __init__(self, name: str | None):
-        if name is None:
-            name = ""
-        self.name = name
+    # NOTE: 同じ名前のインスタンスは使い回し, 判定結果も生成時に計算しておく.
+    _cache: dict = {}
+
+    def __new__(cls, name: str | None):
+        obj = cls._cache.get(name)
+        if obj is None:
+            obj = super().__new__(cls, name)
+            obj.name = "" if name is None else name
+            obj._is_none = obj.name == ""
+            obj._is_group_shield = "G" in obj.name
+            cls._cache[name] = obj
+        return obj
 
     def is_none(self) -> bool:
-        return self.name == ""
+        return self._is_none
 
     def is_group_shield(self) -> bool:
-        return self.name.count("G") > 0
+        return self._is_group_shield
 
 
 class Shield(Allocatables):
+    __slots__ = (
+        "name",
+        "type",
+        "layer",
+        "x_min",
+        "x_max",
+        "_x_interval",
+        "_width",
+        "_space",
+    )
 
     def __init__(
         self,
         name: str,
         type: ShieldType,
         layer: int,
-        x_min: Decimal,
-        x_max: Decimal,
-        width: Decimal,
-        space: Decimal,
+        x_min: COORD,
+        x_max: COORD,
+        width: COORD,
+        space: COORD,
     ):
         self.name = name
         self.type = type
@@ -148,15 +201,15 @@ class Shield(Allocatables):
         return self._x_interval
 
     @property
-    def width(self) -> Decimal:
+    def width(self) -> COORD:
         return self._width
 
     @property
-    def upper_space(self) -> Decimal:
+    def upper_space(self) -> COORD:
         return self._space
 
     @property
-    def lower_space(self) -> Decimal:
+    def lower_space(self) -> COORD:
         return self._space
 
     def extend(self, other_x_iv: Interval) -> Shield:
@@ -179,6 +232,8 @@ class Shield(Allocatables):
 
 
 class Allocatables(ABC):
+    __slots__ = ()
+
     @property
     @abstractmethod
     def x_interval(self):
@@ -206,49 +261,48 @@ class WireAllocatables(Allocatables, ABC):
     def pins(self) -> list[Pin]:
         pass
 
-    @property
-    def y_mid_upper(self) -> Decimal:
-        n_pins = len(self.pins)
-        sorted_pins = sorted(self.pins, key=lambda p: p.y)
-        y_mid_up = 0
-        if not n_pins % 2 == 0:
-            bu = n_pins // 2 + 1
-            m = sorted_pins[bu - 1]
-            y_mid_up = m.y
-        else:
-            u = n_pins // 2 + 1
-            upper_pin = sorted_pins[u - 1]
-            y_mid_up = upper_pin.y
-        return y_mid_up
+    # NOTE: ピンは構築後に変更しない前提で, ソート結果と中央値を使い回す.
+    @cached_property
+    def _sorted_pins_by_y(self) -> list[Pin]:
+        return sorted(self.pins, key=lambda p: p.y)
 
-    @property
-    def y_mid_lower(self) -> Decimal:
-        n_pins = len(self.pins)
-        sorted_pins = sorted(self.pins, key=lambda p: p.y)
-        y_mid_low = 0
+    @cached_property
+    def pins_y(self) -> np.ndarray:
+        return np.fromiter((p.y for p in self.pins), dtype=np.int64)
+
+    @cached_property
+    def y_mid_upper(self) -> COORD:
+        sorted_pins = self._sorted_pins_by_y
+        return sorted_pins[len(sorted_pins) // 2].y
+
+    @cached_property
+    def y_mid_lower(self) -> COORD:
+        sorted_pins = self._sorted_pins_by_y
+        n_pins = len(sorted_pins)
         if not n_pins % 2 == 0:
-            bu = n_pins // 2 + 1
-            m = sorted_pins[bu - 1]
-            y_mid_low = m.y
-        else:
-            b = n_pins // 2
-            bottom_pin = sorted_pins[b - 1]
-            y_mid_low = bottom_pin.y
-        return y_mid_low
+            return sorted_pins[n_pins // 2].y
+        return sorted_pins[n_pins // 2 - 1].y
 
-    @property
-    def y_mid(self) -> Decimal:
-        ym = (self.y_mid_lower + self.y_mid_upper) / 2
+    @cached_property
+    def y_mid(self) -> COORD:
+        ym = (self.y_mid_lower + self.y_mid_upper) // 2
         return ym
 
-    def vertical_wirelength(self, y: Decimal = None) -> Decimal:
+    @cached_property
+    def _sorted_pins_y_cumsum(self) -> tuple[list[COORD], list[COORD]]:
+        sorted_pins_y = [p.y for p in self._sorted_pins_by_y]
+        return sorted_pins_y, list(accumulate(sorted_pins_y, initial=0))
+
+    def vertical_wirelength(self, y: COORD = None) -> COORD:
         if y is None:
             y = self.y_mid
 
-        ans = Decimal("0.0")
-        for p in self.pins:
-            ans += abs(p.y - y)
-        return ans
+        # ソート済みピンの累積和から, yより下と上のピンまでの距離の合計を求める
+        sorted_pins_y, cumsum = self._sorted_pins_y_cumsum
+        k = bisect_left(sorted_pins_y, y)
+        lower = y * k - cumsum[k]
+        upper = (cumsum[-1] - cumsum[k]) - y * (len(sorted_pins_y) - k)
+        return lower + upper
 
 
 class Net(WireAllocatables):
@@ -257,24 +311,26 @@ class Net(WireAllocatables):
         self,
         name: str,
         layer: int,
-        width: Decimal,
-        space: Decimal,
-        x_min: Decimal = None,
-        x_max: Decimal = None,
+        width: COORD,
+        space: COORD,
+        x_min: COORD = None,
+        x_max: COORD = None,
         pins: list[Pin] = None,
         shield_type: str = None,
         group_no: str = None,
     ):
         if x_min is None and x_max is None:
             assert pins is not None, "pins should be given..."
-            x_min = min([p.x for p in pins])
-            x_max = max([p.x for p in pins])
+            x_min = min(p.x for p in pins)
+            x_max = max(p.x for p in pins)
             if x_min == x_max:
-                x_max += Decimal("0.0000001")
+                x_max += to_coord("0.0000001")
 
         self.name = name
+        self._group_name = self.parse_group_name(name)
         self.layer = layer
         self.shield_type = ShieldType(shield_type)
+        self._require_shield = not self.shield_type.is_none()
         self._width = width
         self._space = space
         self.x_min = x_min
@@ -296,15 +352,15 @@ class Net(WireAllocatables):
         return self._x_interval
 
     @property
-    def width(self) -> Decimal:
+    def width(self) -> COORD:
         return self._width
 
     @property
-    def upper_space(self) -> Decimal:
+    def upper_space(self) -> COORD:
         return self._space
 
     @property
-    def lower_space(self) -> Decimal:
+    def lower_space(self) -> COORD:
         return self._space
 
     @property
@@ -313,28 +369,50 @@ class Net(WireAllocatables):
 
     @property
     def group_name(self) -> str:
-        net_name = self.name
-        if "_" in self.name:
-            i = self.name.index("_")
+        return self._group_name
+
+    @staticmethod
+    def parse_group_name(name: str) -> str:
+        i = name.find("_")
+        if i >= 0:
             # NOTE: 0~3 までしかないから+2でOK
-            net_name = self.name[: i + 2]
-        elif "<" in self.name:
-            i = self.name.index("<")
-            net_name = self.name[:i]
-        return net_name
+            return name[: i + 2]
+        i = name.find("<")
+        if i >= 0:
+            return name[:i]
+        return name
 
     def require_shield(self) -> bool:
-        return not self.shield_type.is_none()
+        return self._require_shield
 
     def __repr__(self) -> str:
-        return f"{self.name}: [{self.x_min}, {self.x_max}]"
+        return f"{self.name}: [{to_decimal(self.x_min)}, {to_decimal(self.x_max)}]"
 
 
 class Allocation(Allocatables):
-    def __init__(self, data: Allocatables, offset: Decimal):
+    __slots__ = (
+        "data",
+        "offset",
+        "_x_interval",
+        "_width",
+        "_upper_space",
+        "_lower_space",
+        "_y_max",
+        "_y_max_with_space",
+        "_y_interval",
+    )
+
+    def __init__(self, data: Allocatables, offset: COORD):
         self.data = data
         self.offset = offset
         self._x_interval = Interval(data.x_interval.begin, data.x_interval.end, self)
+        # NOTE: 配置後は要素の幾何情報が変わらない前提で, 生成時に計算しておく.
+        self._width = data.width
+        self._upper_space = data.upper_space
+        self._lower_space = data.lower_space
+        self._y_max = offset + self._width
+        self._y_max_with_space = self._y_max + self._upper_space
+        self._y_interval = Interval(offset, self._y_max, self)
 
     @property
     def type(self) -> str:
@@ -345,16 +423,16 @@ class Allocation(Allocatables):
         return self._x_interval
 
     @property
-    def width(self) -> Decimal:
-        return self.data.width
+    def width(self) -> COORD:
+        return self._width
 
     @property
-    def upper_space(self) -> Decimal:
-        return self.data.upper_space
+    def upper_space(self) -> COORD:
+        return self._upper_space
 
     @property
-    def lower_space(self) -> Decimal:
-        return self.data.lower_space
+    def lower_space(self) -> COORD:
+        return self._lower_space
 
     @property
     def name(self) -> str:
@@ -366,28 +444,30 @@ class Allocation(Allocatables):
             raise ValueError(f"Invalid data type: {type(self.data)}")
 
     @property
-    def x_min(self) -> Decimal:
+    def x_min(self) -> COORD:
         return self.x_interval.begin
 
     @property
-    def x_max(self) -> Decimal:
+    def x_max(self) -> COORD:
         return self.x_interval.end
 
     @property
-    def y_min(self) -> Decimal:
+    def y_min(self) -> COORD:
         return self.offset
 
     @property
-    def y_max(self) -> Decimal:
-        return self.offset + self.data.width
+    def y_max(self) -> COORD:
+        return self._y_max
 
     @property
-    def y_max_with_space(self) -> Decimal:
-        return self.offset + self.data.width + self.data.upper_space
+    def y_max_with_space(self) -> COORD:
+        return self._y_max_with_space
 
     @property
     def y_interval(self) -> Interval:
-        return Interval(self.offset, self.offset + self.width, self)
+        return self._y_interval
 
     def __repr__(self):
-        return f"{type(self.data)}: [{self.offset},{self.offset+self.width}]"
+        return (
+            f"{type(self.data)}: [{to_decimal(self.offset)},{to_decimal(self._y_max)}]"
+        )
@@ -1,30 +1,143 @@
-from decimal import Decimal
-from intervaltree import Interval, IntervalTree
+import bisect
+from intervaltree import Interval
 from gcr import entities, containers
+from gcr.entities import COORD
+
+
+class SortedIntervalIndex:
+    """beginでソートした配列で区間を管理するクラス
+
+    追加と重なり検索のみをサポートする.
+    重なり検索は, 区間長の最大値でbeginの探索範囲を絞り込み, 二分探索で行う.
+    """
+
+    def __init__(self) -> None:
+        self._begins = []
+        self._ends = []
+        self._data = []
+        self._max_length = 0
+
+    def __len__(self) -> int:
+        return len(self._begins)
+
+    def __iter__(self):
+        for begin, end, data in zip(self._begins, self._ends, self._data):
+            yield Interval(begin, end, data)
+
+    def __repr__(self) -> str:
+        return "\n".join(repr(iv) for iv in self)
+
+    def add(self, iv: Interval) -> None:
+        if iv.is_null():
+            raise ValueError(f"IntervalIndex: Null Interval objects not allowed: {iv}")
+        i = bisect.bisect_right(self._begins, iv.begin)
+        self._begins.insert(i, iv.begin)
+        self._ends.insert(i, iv.end)
+        self._data.insert(i, iv.data)
+        self._max_length = max(self._max_length, iv.end - iv.begin)
+
+    def overlap(self, begin: COORD, end: COORD) -> list:
+        """[begin, end)と重なる区間のdataを返す"""
+        if begin >= end:
+            return []
+        # 重なる区間は begin - max_length < iv.begin < end を満たす
+        lo = bisect.bisect_right(self._begins, begin - self._max_length)
+        hi = bisect.bisect_left(self._begins, end, lo)
+        ends = self._ends
+        return [self._data[i] for i in range(lo, hi) if ends[i] > begin]
+
+
+def compute_offset(
+    allocs: list[entities.Allocation],
+    ceiling: COORD,
+    lower_space: COORD,
+    upper_space: COORD,
+    width: COORD,
+) -> COORD | None:
+    """x軸で重なる配置済み要素から, 天井制約下での配置高さを計算する
+
+    天井が配置済み要素またはその上側スペースの内部にある場合は無効.
+    天井より下の要素のうち, スペース込みで最も高いものの上に配置する.
+
+    Args:
+        allocs (list[entities.Allocation]): x軸で重なる配置済み要素
+        ceiling (COORD): 天井制約の高さ
+        lower_space (COORD): 配置する要素の下側スペース
+        upper_space (COORD): 配置する要素の上側スペース
+        width (COORD): 配置する要素の幅
+
+    Returns:
+        COORD | None: 配置高さ. 配置できない場合はNone
+    """
+    # 天井が下側スペースに含まれる場合, そのスペース分だけ天井から離す
+    ceiling_space = 0
+    # 天井より下にある要素のスペース込みの最大高さと, その中で最小の上側スペース
+    y_max = None
+    space_min = 0
+    for a in allocs:
+        a_y_min = a.y_min
+        a_y_max = a.y_max
+        if ceiling < a_y_min:
+            # 天井が要素の下側スペースに含まれる場合
+            a_y_min_with_space = a_y_min - a.lower_space
+            if a_y_min_with_space <= ceiling:
+                ceiling_space = max(ceiling_space, ceiling - a_y_min_with_space)
+        elif a_y_max <= ceiling:
+            # 天井が要素の上側スペースの内部にある場合は無効
+            a_y_max_with_space = a.y_max_with_space
+            if ceiling < a_y_max_with_space:
+                return None
+            # below ceiling..
+            if 0 < a_y_max:
+                a_upper_space = a.upper_space
+                if y_max is None or y_max < a_y_max_with_space:
+                    y_max = a_y_max_with_space
+                    space_min = a_upper_space
+                elif y_max == a_y_max_with_space and a_upper_space < space_min:
+                    space_min = a_upper_space
+        elif a_y_min < ceiling:
+            # 天井が要素の内部にある場合は無効
+            return None
+
+    if y_max is None:
+        y_max = 0
+    offset = y_max - space_min + max(space_min, lower_space)
+
+    # allocatable check
+    if offset + width + max(upper_space, ceiling_space) > ceiling:
+        return None
+    return offset
 
 
 class RoutingArea:
     def __init__(
         self,
         id: int = None,
-        width: Decimal = Decimal("inf"),
-        height: Decimal = None,
+        width: COORD = float("inf"),
+        height: COORD = None,
     ) -> None:
         self.id = id
         self.width = width
         self.height = height
-        self.x_iv_tree = IntervalTree()
+        self.x_iv_index = SortedIntervalIndex()
+        # NOTE: 配置のたびに更新し, allocationsのキャッシュの有効性判定に使う
+        self._version = 0
+        self._allocations_cache = (-1, [])
         # NOTE: 予約領域による初期天井を記録
         self.init_ceilings = []
 
     @property
-    def y_mid(self) -> Decimal:
-        return self.height + self.width / 2
+    def y_mid(self) -> COORD:
+        return self.height + self.width // 2
 
     @property
     def allocations(self) -> list[entities.Allocation]:
+        version, alcs = self._allocations_cache
+        if version == self._version:
+            return alcs
+
         alcs = []
-        for iv in self.x_iv_tree:
+        for iv in self.x_iv_index:
             a = iv.data
             if isinstance(a.data, containers.ShieldedNetList):
                 bundled_allocation = a.data
@@ -44,6 +157,7 @@ class RoutingArea:
                     upper_space_of_bottom_obj = o.upper_space
             else:
                 alcs.append(a)
+        self._allocations_cache = (self._version, alcs)
         return alcs
 
     @property
@@ -51,82 +165,15 @@ class RoutingArea:
         return [a for a in self.allocations if not isinstance(a, entities.Blockage)]
 
     def __repr__(self) -> str:
-        return self.x_iv_tree.print_structure(tostring=True)
+        return repr(self.x_iv_index)
 
     def x_overlapped_allocations(self, x_iv: Interval) -> list[entities.Allocation]:
-        ivs = self.x_iv_tree.overlap(x_iv)
-        allocs = [iv.data for iv in ivs]
+        allocs = self.x_iv_index.overlap(x_iv.begin, x_iv.end)
         return allocs
 
-    def build_y_intervaltree(
-        self, allocs: list[entities.Allocation], include_space: bool = False
-    ) -> IntervalTree:
-        y_iv_tree = IntervalTree()
-        for a in allocs:
-            # print(a.name)
-            # print(a.width)
-            y_iv_tree.add(a.y_interval)
-
-            if include_space:
-                if a.lower_space > Decimal("0.0"):
-                    sb = entities.Space(
-                        entities.SpaceType.BELOW,
-                        a.offset - a.lower_space,
-                        a.offset,
-                    )
-                    y_iv_tree.add(sb.y_interval)
-
-                if a.upper_space > Decimal("0.0"):
-                    sa = entities.Space(
-                        entities.SpaceType.ABOVE,
-                        a.y_max_with_space - a.upper_space,
-                        a.y_max_with_space,
-                    )
-                    y_iv_tree.add(sa.y_interval)
-        return y_iv_tree
-
-    def y_max_space_min(
-        self, allocs: list[entities.Allocation]
-    ) -> tuple[Decimal, Decimal]:
-        if allocs == []:
-            return Decimal(0), Decimal(0)
-
-        y_max = max([a.y_max_with_space for a in allocs])
-        space_min = Decimal("inf")
-        for a in allocs:
-            if a.y_max_with_space == y_max and a.upper_space < space_min:
-                space_min = a.upper_space
-        return y_max, space_min
-
-    def get_ceiling_space(
-        self, ceiling: Decimal, x_iv: Interval = None
-    ) -> Decimal | None:
-        """If invalid ceiling is given, return None"""
-        # get allocations overlapped given trunk in x-axis
-        x_overlapped_allocs: list = self.x_overlapped_allocations(x_iv)
-        # build space y_iv_tree
-        space_y_iv_tree = self.build_y_intervaltree(
-            x_overlapped_allocs, include_space=True
-        )
-        # get space set overlapped with given ceiling
-        overlapped_spaces = space_y_iv_tree.at(ceiling)
-        # if ceiling is inside interval of ABOVE space,
-        # then ceiling is invalid ...
-        ceiling_space = Decimal("0.0")
-        for osp in list(overlapped_spaces):
-            if not isinstance(osp.data, entities.Space):
-                if not osp.begin == ceiling:
-                    return None
-            else:
-                if osp.data.type == entities.SpaceType.ABOVE:
-                    return None
-
-            ceiling_space = max(ceiling_space, ceiling - osp.begin)
-        return ceiling_space
-
     def get_offset(
-        self, alc: entities.Allocatables, ceiling: Decimal = None
-    ) -> Decimal | None:
+        self, alc: entities.Allocatables, ceiling: COORD = None
+    ) -> COORD | None:
         """If not allocatable, return None."""
         # ceilingがない場合: ceiling = w(g)
         if ceiling is None:
@@ -134,48 +181,38 @@ class RoutingArea:
 
         # get allocations overlapped given trunk in x-axis
         x_overlapped_allocs: list = self.x_overlapped_allocations(alc.x_interval)
-        # build y-axis intervaltree
-        y_iv_tree = self.build_y_intervaltree(x_overlapped_allocs)
-
-        # if ceiling_space is invalid, return None...
-        ceiling_space = self.get_ceiling_space(ceiling, alc.x_interval)
-        if ceiling_space is None:
-            return None
-
-        # NOTE: ここから下は, ceilingがvalidな条件...
-        # below ceiling..
-        y_ivs_below_ceiling = y_iv_tree.overlap(Decimal(0), ceiling) - y_iv_tree.at(
-            ceiling
+        return compute_offset(
+            x_overlapped_allocs,
+            ceiling,
+            alc.lower_space,
+            alc.upper_space,
+            alc.width,
         )
-        allocs_below_ceiling = [iv.data for iv in y_ivs_below_ceiling]
-        y_max, space_min = self.y_max_space_min(allocs_below_ceiling)
-        offset = y_max - space_min + max(space_min, alc.lower_space)
-
-        # allocatable check
-        if offset + alc.width + max(alc.upper_space, ceiling_space) > ceiling:
-            return None
-        return offset
 
-    def allocatable(self, alc: entities.Allocatables, ceiling: Decimal = None) -> bool:
+    def allocatable(self, alc: entities.Allocatables, ceiling: COORD = None) -> bool:
         if self.get_offset(alc, ceiling) is None:
             return False
         return True
 
-    def __allocate(self, o: entities.Allocatables, offset: Decimal) -> Decimal:
+    def __allocate(self, o: entities.Allocatables, offset: COORD) -> COORD:
         a = entities.Allocation(o, offset)
-        self.x_iv_tree.add(a.x_interval)
+        self.x_iv_index.add(a.x_interval)
+        self._version += 1
         return a.y_max_with_space
 
-    def __allocate_blockage(self, b: entities.Blockage) -> Decimal:
+    def __allocate_blockage(self, b: entities.Blockage, ceiling: COORD = None) -> COORD:
+        # NOTE: 予約領域の上下辺の高さを記録
+        self.init_ceilings.append(b.y_min)
+        self.init_ceilings.append(b.y_max)
         # validate
         x_overlapped_allocs: list = self.x_overlapped_allocations(b.x_interval)
-        y_iv_tree = self.build_y_intervaltree(x_overlapped_allocs)
-        if y_iv_tree.overlap(b.y_min, b.y_max) != set():
-            raise ValueError(f"Cannot allocate blockage {b}...")
+        for a in x_overlapped_allocs:
+            if a.y_min < b.y_max and b.y_min < a.y_max:
+                raise ValueError(f"Cannot allocate blockage {b}...")
         # allocate
         return self.__allocate(b, b.y_min)
 
-    def __allocate_net(self, n: entities.Net, ceiling: Decimal = None) -> Decimal:
+    def __allocate_net(self, n: entities.Net, ceiling: COORD = None) -> COORD:
         # validate allocation
         offset = self.get_offset(n, ceiling)
         if offset is None:
@@ -183,13 +220,13 @@ class RoutingArea:
         # allocate
         return self.__allocate(n, offset)
 
-    def __allocate_shield(self, s: entities.Shield, ceiling: Decimal = None) -> Decimal:
+    def __allocate_shield(self, s: entities.Shield, ceiling: COORD = None) -> COORD:
         # TODO: fix me if yhou need shield-sharing...
         return self.__allocate_net(s, ceiling)
 
     def __allocate_netlist(
-        self, snl: containers.ShieldedNetList, ceiling: Decimal = None
-    ) -> Decimal:
+        self, snl: containers.ShieldedNetList, ceiling: COORD = None
+    ) -> COORD:
         y_max = None
         for o in snl:
             if isinstance(o, entities.Net):
@@ -203,8 +240,8 @@ class RoutingArea:
         return y_max
 
     def __allocate_shielddict(
-        self, sd: containers.ShieldDict, ceiling: Decimal = None
-    ) -> Decimal:
+        self, sd: containers.ShieldDict, ceiling: COORD = None
+    ) -> COORD:
         y_maxs = []
         for shield_name, snl in sd.items():
             if snl.is_group_net:
@@ -215,37 +252,43 @@ class RoutingArea:
         return max(y_maxs)
 
     def __allocate_overlappedintervaldict(
-        self, oid: containers.OverlappedIntervalDict, ceiling: Decimal
-    ) -> Decimal:
+        self, oid: containers.OverlappedIntervalDict, ceiling: COORD
+    ) -> COORD:
         y_maxs = []
         for interval, shielddict in oid.items():
             y_max = self.__allocate_shielddict(shielddict, ceiling)
             y_maxs.append(y_max)
         return max(y_maxs)
 
-    def allocate(self, o: entities.Allocatables, ceiling: Decimal = None) -> Decimal:
+    def allocate(self, o: entities.Allocatables, ceiling: COORD = None) -> COORD:
         # TODO: fix me to add validation...
         # print(type(o))
         # print(isinstance(o, entities.Allocatables))
         # print(issubclass(type(o), entities.Allocatables))
         # assert isinstance(o, entities.Allocatables), "Invalid value is given..."
 
+        allocator = self.__allocators.get(type(o))
+        if allocator is None:
+            # NOTE: サブクラスの場合は登録順にisinstanceで探す
+            for cls, f in self.__allocators.items():
+                if isinstance(o, cls):
+                    allocator = f
+                    break
+            else:
+                raise ValueError(
+                    f"Invalid value is given. {o} should be Net or Shield."
+                )
+        return allocator(self, o, ceiling)
+
+    # 型ごとの配置関数
+    __allocators = {
         # entities
-        if isinstance(o, entities.Blockage):
-            # NOTE: 予約領域の上下辺の高さを記録
-            self.init_ceilings.append(o.y_min)
-            self.init_ceilings.append(o.y_max)
-            return self.__allocate_blockage(o)
-        elif isinstance(o, entities.Net):
-            return self.__allocate_net(o, ceiling)
-        elif isinstance(o, entities.Shield):
-            return self.__allocate_shield(o, ceiling)
+        entities.Blockage: __allocate_blockage,
+        entities.Net: __allocate_net,
+        entities.Shield: __allocate_shield,
         # containers
-        elif isinstance(o, list) or isinstance(o, containers.ShieldedNetList):
-            return self.__allocate_netlist(o, ceiling)
-        elif isinstance(o, containers.ShieldDict):
-            return self.__allocate_shielddict(o, ceiling)
-        elif isinstance(o, containers.OverlappedIntervalDict):
-            return self.__allocate_overlappedintervaldict(o, ceiling)
-        else:
-            raise ValueError(f"Invalid value is given. {o} should be Net or Shield.")
+        list: __allocate_netlist,
+        containers.ShieldedNetList: __allocate_netlist,
+        containers.ShieldDict: __allocate_shielddict,
+        containers.OverlappedIntervalDict: __allocate_overlappedintervaldict,
+    }
@@ -6,6 +6,18 @@ from decimal import Decimal
 from datetime import datetime
 from collections import defaultdict
 from gcr import routing_area, entities
+from gcr.entities import COORD
+
+# NOTE: orjsonは任意の依存ライブラリ(fast-json extra). ない場合は標準のjsonで書き出す.
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# 上に逃げる配線: _*
+AVOID_BLOCK_PATTERN = re.compile(r"_(\d+)")
+# 束配線: <>
+GROUP_NO_PATTERN = re.compile(r"<(\d+)>")
 
 
 def get_str_datetime() -> str:
@@ -26,14 +38,10 @@ def get_n_routing_areas_used(routing_areas: list[routing_area.RoutingArea]) -> i
     Returns:
         int: _description_
     """
-    n_ras_used = 0
-    for ra in routing_areas:
-        if ra.allocations_without_blockage != []:
-            n_ras_used += 1
-    return n_ras_used
+    return sum(1 for ra in routing_areas if ra.allocations_without_blockage)
 
 
-def lower_bound_vwl(igs: list) -> Decimal:
+def lower_bound_vwl(igs: list) -> COORD:
     # lower bound of wirelength
     lower_bound_wirelength = 0
     for ig in igs:
@@ -41,16 +49,16 @@ def lower_bound_vwl(igs: list) -> Decimal:
     return lower_bound_wirelength
 
 
-def calc_vertical_wirelength(ra: routing_area.RoutingArea) -> Decimal:
+def calc_vertical_wirelength(ra: routing_area.RoutingArea) -> COORD:
     """与えられた配線領域内に配線されたネットの垂直配線長の合計を計算する.
 
     Args:
         ra (routing_area.RoutingArea): 対象配線領域
 
     Returns:
-        Decimal: 合計垂直配線長
+        COORD: 合計垂直配線長
     """
-    twl = Decimal("0.0")
+    twl = 0
     for alc in ra.allocations:
         if not isinstance(alc.data, entities.Net):
             continue
@@ -58,14 +66,16 @@ def calc_vertical_wirelength(ra: routing_area.RoutingArea) -> Decimal:
     return twl
 
 
-def total_vertical_wirelength(ras: list[routing_area.RoutingArea]) -> Decimal:
+def total_vertical_wirelength(
+    ras: list[routing_area.RoutingArea],
+) -> COORD:
     """与えられた複数の配線領域内に配線されたネットの垂直配線長の合計を計算する.
 
     Args:
         ras (list[routing_area.RoutingArea]): 対象配線領域のリスト
 
     Returns:
-        Decimal: 合計垂直配線長
+        COORD: 合計垂直配線長
     """
     twl = 0
     for ra in ras:
@@ -83,27 +93,35 @@ class RoutingResultSerializer:
             "name": alc.name,
             "type": alc.type,
             "x_interval": {
-                "min": alc.x_min,
-                "max": alc.x_max,
+                "min": entities.to_decimal(alc.x_min),
+                "max": entities.to_decimal(alc.x_max),
             },
             "y_interval": {
-                "min": alc.y_min,
-                "max": alc.y_max,
+                "min": entities.to_decimal(alc.y_min),
+                "max": entities.to_decimal(alc.y_max),
             },
         }
 
+    def __serialize_routing_areas(
+        self, ras: list[routing_area.RoutingArea]
+    ) -> dict[str, list[dict]]:
+        # NOTE: 配置のないRAは出力しない.
+        # JSONとmsgpackで読み込み結果を揃えるため, キーは文字列にする
+        contents = {}
+        for ra in ras:
+            alcs = ra.allocations
+            if not alcs:
+                continue
+            contents.setdefault(str(ra.id), []).extend(
+                [self.convert_allocation_to_json(a) for a in alcs]
+            )
+        return contents
+
     def __serialize_gap_allocation(
         self, json_contents: dict, gaps: list[routing_area.RoutingArea]
     ) -> None:
         # gap, id, allocations
-        json_contents["gaps"] = defaultdict(list)
-        for g in gaps:
-            for a in g.allocations:
-                aj = self.convert_allocation_to_json(a)
-                if type(aj) == list:
-                    pass
-                else:
-                    json_contents["gaps"][g.id].append(aj)
+        json_contents["gaps"] = self.__serialize_routing_areas(gaps)
 
     def __serialize_subchannel_allocation(
         self, json_contents: dict, subchannels_dict: dict
@@ -111,11 +129,9 @@ class RoutingResultSerializer:
         # subchannel, col, id, allocations
         json_contents["subchannel"] = {}
         for col, subchannels in subchannels_dict.items():
-            json_contents["subchannel"][col] = defaultdict(list)
-            for subchannel in subchannels:
-                for a in subchannel.allocations:
-                    aj = self.convert_allocation_to_json(a)
-                    json_contents["subchannel"][col][subchannel.id].append(aj)
+            json_contents["subchannel"][str(col)] = self.__serialize_routing_areas(
+                subchannels
+            )
 
     def serialize(
         self, fname: str, gaps: list = None, subchannels: dict = None
@@ -128,17 +144,41 @@ class RoutingResultSerializer:
         if subchannels is not None:
             self.__serialize_subchannel_allocation(json_contents, subchannels)
 
-        self.save_json(fsavepath, json_contents)
+        # NOTE: 拡張子が.msgpackの場合はバイナリ形式で保存する
+        if fsavepath.endswith(".msgpack"):
+            self.save_msgpack(fsavepath, json_contents)
+        else:
+            self.save_json(fsavepath, json_contents)
+
+    @staticmethod
+    def decimal_to_str(obj):
+        if isinstance(obj, Decimal):
+            return str(obj)
 
     def save_json(self, save_path: str, contents: list) -> None:
         os.makedirs(os.path.dirname(save_path), exist_ok=True)
-
-        def decimal_to_str(obj):
-            if isinstance(obj, Decimal):
-                return str(obj)
+        if orjson is not None:
+            data = orjson.dumps(
+                contents,
+                default=self.decimal_to_str,
+                option=orjson.OPT_INDENT_2,
+            )
+            with open(save_path, "wb") as f:
+                f.write(data)
+            return
 
         with open(save_path, "w") as f:
-            json.dump(contents, f, indent=2, default=decimal_to_str)
+            json.dump(contents, f, indent=2, default=self.decimal_to_str)
+
+    def save_msgpack(self, save_path: str, contents: list) -> None:
+        # NOTE: msgpackは任意の依存ライブラリ
+        import msgpack
+
+        os.makedirs(os.path.dirname(save_path), exist_ok=True)
+        with open(save_path, "wb") as f:
+            f.write(
+                msgpack.packb(contents, default=self.decimal_to_str, use_bin_type=True)
+            )
 
 
 class RoutingResultDeserializer:
@@ -148,10 +188,20 @@ class RoutingResultDeserializer:
 
     def deserialize(self, fname: str) -> dict:
         fsavepath = os.path.join(self.problem_settings.save_dir, fname)
+        if fsavepath.endswith(".msgpack"):
+            return self.load_msgpack(fsavepath)
         with open(fsavepath, "r") as f:
             allocations = json.load(f)
         return allocations
 
+    def load_msgpack(self, fpath: str) -> dict:
+        # NOTE: msgpackは任意の依存ライブラリ
+        import msgpack
+
+        with open(fpath, "rb") as f:
+            allocations = msgpack.unpackb(f.read())
+        return allocations
+
 
 def load_yaml(fpath: str) -> dict:
     """yamlファイルを読み込む.
@@ -223,28 +273,28 @@ def read_netlist_from_csv(fpath: str, problem_settings) -> dict:
 
             # 上に逃げる配線: _*
             avoid_block_no = None
-            pattern = r"_(\d+)"
-            m = re.search(pattern, name)
+            m = AVOID_BLOCK_PATTERN.search(name)
             if m:
                 avoid_block_no = m.group(1)
 
             # 束配線: <>
             group_no = None
-            pattern = r"<(\d+)>"
-            m = re.search(pattern, name)
+            m = GROUP_NO_PATTERN.search(name)
             if m:
                 group_no = m.group(1)
 
             layer = row[1]
-            net_width = Decimal(row[2])
-            net_space = Decimal(row[3])
+            net_width = entities.to_coord(row[2])
+            net_space = entities.to_coord(row[3])
             shield_type = row[4]
             pins_coord = row[5:]
             pin_names = pins_coord[0::3]
             px = pins_coord[1::3]
             py = pins_coord[2::3]
             pins = [
-                entities.Pin(Decimal(x), Decimal(y)) for x, y in zip(px, py) if x != ""
+                entities.Pin(entities.to_coord(x), entities.to_coord(y))
+                for x, y in zip(px, py)
+                if x != ""
             ]
             # 追加の逃げるpin
             if avoid_block_no:
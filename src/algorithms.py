@@ -1,10 +1,10 @@
+import bisect
 import heapq
 import numpy as np
-from decimal import Decimal
 from gcr import entities, routing_area
-from collections import defaultdict
+from gcr.entities import COORD
 from intervaltree import Interval
-from functools import cmp_to_key
+from operator import attrgetter
 
 
 def greedy_allocate_bundles(
@@ -25,10 +25,17 @@ def greedy_allocate_bundles(
     unallocatable_net_group_names = []
 
     for b in sorted_bundles:
-        best_vwl = Decimal(float("inf"))
+        best_vwl = float("inf")
         best_start_idx = 0
 
         for i in range(len(gap_heights) - len(b) + 1):
+            # NOTE: 配線長の計算は配置可能判定より軽いため先に行い,
+            # 最良値を更新しない場合は判定を省略する
+            heights = gap_heights[i : i + len(b)]
+            vwl = b.vertical_wirelength_with_multi_y(heights)
+            if not best_vwl > vwl:
+                continue
+
             # assignable check
             assignable = True
             for g, elm in zip(ras[i : i + len(b)], b):
@@ -39,13 +46,10 @@ def greedy_allocate_bundles(
             if not assignable:
                 continue
 
-            heights = gap_heights[i : i + len(b)]
-            vwl = b.vertical_wirelength_with_multi_y(heights)
-            if best_vwl > vwl:
-                best_vwl = vwl
-                best_start_idx = i
+            best_vwl = vwl
+            best_start_idx = i
 
-        if best_vwl == Decimal(float("inf")):
+        if best_vwl == float("inf"):
             print(f"Cannot assign: {b.name}")
             unallocatable_net_group_names.append(b.name)
         else:
@@ -74,15 +78,31 @@ def get_optimal_routing_areas(oid, ras: list) -> list[routing_area.RoutingArea]:
     return optimal_ras
 
 
+def argsort_distances(diff: np.ndarray) -> np.ndarray:
+    """距離の昇順に並べたindexを最終軸に沿って返す
+
+    距離が等しい要素の順序はnumpyのソート実装と配列のdtypeに依存する.
+    同距離の配線領域の選び方で配線結果が変わるため, 同距離の要素は
+    常にobject配列としてargsortした場合の順序に並べる.
+
+    Args:
+        diff (np.ndarray): 距離の配列
+
+    Returns:
+        np.ndarray: ソート後のindex
+    """
+    return np.argsort(diff.astype(object), axis=-1)
+
+
 def get_best_routing_area(
     oid, ras: list[routing_area.RoutingArea]
 ) -> routing_area.RoutingArea:
-    ra_heights = np.array([ra.y_mid for ra in ras])
-    diff = np.abs(ra_heights.T - np.array([oid.y_mid])).T
-    sorted_args_diff = np.argsort(diff)
+    y_mid = oid.y_mid
+    diff = [abs(ra.y_mid - y_mid) for ra in ras]
+    sorted_args_diff = argsort_distances(np.array(diff))
     first_close_idx = sorted_args_diff[0]
     # 残りのgapが一つしかない場合には2ndは1stと同一にする
-    if len(ra_heights) == 1:
+    if len(diff) == 1:
         second_close_idx = first_close_idx
     else:
         second_close_idx = sorted_args_diff[1]
@@ -111,7 +131,7 @@ def left_edge(oids: list, ras: list[routing_area.RoutingArea], use_gco=False):
         _type_: _description_
     """
     # Left-edgeの基準線
-    remaining_oids = sorted(oids, key=lambda x: x.x_interval.begin)
+    remaining_oids = sorted(oids, key=attrgetter("x_interval.begin"))
     # 配線した配線領域
     routed_ras = []
     # 天井制約を保持する優先度付きキュー
@@ -146,36 +166,49 @@ def left_edge(oids: list, ras: list[routing_area.RoutingArea], use_gco=False):
             else:
                 height_limit = height_limit_queue[0]
 
-            x = Decimal(float("-inf"))
-            remove_oids = []
-            for oid in remaining_oids:
-                if all(
-                    [
-                        x < oid.x_interval.begin,
-                        target_ra.allocatable(oid, height_limit),
-                    ]
-                ):
+            x = float("-inf")
+            # 配線したnetの位置を記録
+            routed = bytearray(len(remaining_oids))
+            x_begins, x_ends = x_bounds(remaining_oids)
+            oid_is_routed = False
+            for i, oid in enumerate(remaining_oids):
+                if x < x_begins[i] and target_ra.allocatable(oid, height_limit):
                     target_ra.allocate(oid, height_limit)
-                    x = oid.x_interval.end
-                    remove_oids.append(oid)
+                    x = x_ends[i]
+                    routed[i] = True
+                    oid_is_routed = True
 
             # 配線できるものがなければ次のRAへ
-            if remove_oids == []:
+            if not oid_is_routed:
                 if height_limit is None:
                     # RAの上辺の高さの天井制約線で配線できなかった場合, 次のRAへ
                     break
                 else:
                     # 現状の天井制約を破棄し, 次にゆるい天井制約で配線を試みる
-                    heapq.heappop(height_limit_queue)
+                    # NOTE: 同じ高さの天井制約では結果が変わらないため, まとめて破棄する
+                    while height_limit_queue and height_limit_queue[0] == height_limit:
+                        heapq.heappop(height_limit_queue)
                     continue
 
             # 配線したnetを削除
-            for oid in remove_oids:
-                remaining_oids.remove(oid)
+            remaining_oids = [oid for oid, r in zip(remaining_oids, routed) if not r]
 
     return routed_ras, remaining_ras, remaining_oids
 
 
+def x_bounds(oids: list) -> tuple[list[COORD], list[COORD]]:
+    """ネットのx区間の始点と終点をそれぞれリストで取得する関数
+
+    Args:
+        oids (list): _description_
+
+    Returns:
+        tuple[list[COORD], list[COORD]]: 始点のリスト, 終点のリスト
+    """
+    x_ivs = [oid.x_interval for oid in oids]
+    return [iv.begin for iv in x_ivs], [iv.end for iv in x_ivs]
+
+
 def cap_sort(oids: list) -> list:
     """CAPにおけるネットの優先順位付けを行う関数
 
@@ -185,25 +218,8 @@ def cap_sort(oids: list) -> list:
     Returns:
         list: _description_
     """
-
-    def __cap(oid1, oid2) -> int:
-        """
-        Returns:
-        int: -1 if oid1 < oid2; 1 otherwise
-        """
-        # 幅広優先
-        if oid1.width > oid2.width:
-            return -1
-        elif oid1.width < oid2.width:
-            return 1
-
-        # 幅が一緒の場合, 左優先
-        if oid1.x_interval.begin < oid2.x_interval.begin:
-            return -1
-        else:
-            return 1
-
-    return sorted(oids, key=cmp_to_key(__cap))
+    # 幅広優先, 幅が一緒の場合は左優先
+    return sorted(oids, key=lambda oid: (-oid.width, oid.x_interval.begin))
 
 
 def max_density_zones(oids: list) -> tuple[float, list[Interval]]:
@@ -215,30 +231,39 @@ def max_density_zones(oids: list) -> tuple[float, list[Interval]]:
     Returns:
         tuple[float, list[Interval]]: _description_
     """
-    diff_density = defaultdict(list)
-    for oid in oids:
-        diff_density[oid.x_interval.begin].append((oid, "add"))
-        diff_density[oid.x_interval.end].append((oid, "remove"))
-
     max_density = 0
     start_x = None
     zones = []
-    conflict_nets = []
-    # sort via key
-    for k, nl in sorted(diff_density.items(), key=lambda k: k[0]):
-        # print(k)
-        for t in nl:
-            net, command = t
-            if command == "add":
-                conflict_nets.append(net)
-            else:
-                conflict_nets.remove(net)
-
-        if conflict_nets == []:
+    n_oids = len(oids)
+    if n_oids == 0:
+        return max_density, zones
+
+    # 始点で幅を加算, 終点で減算するイベントを座標ごとに集約する
+    x_begins, x_ends = x_bounds(oids)
+    xs, inverse = np.unique(
+        np.array(x_begins + x_ends, dtype=np.int64), return_inverse=True
+    )
+    widths = np.fromiter((oid.width for oid in oids), dtype=np.int64, count=n_oids)
+    diff_density = np.zeros(len(xs), dtype=np.int64)
+    np.add.at(diff_density, inverse, np.concatenate([widths, -widths]))
+    diff_n_nets = np.zeros(len(xs), dtype=np.int64)
+    np.add.at(diff_n_nets, inverse, np.repeat([1, -1], n_oids))
+    # 各座標で最後に処理されるイベントが追加か削除か
+    # (入力順で後のネットが後, 同じネットでは終点が後)
+    event_order = np.concatenate([2 * np.arange(n_oids), 2 * np.arange(n_oids) + 1])
+    last_event = np.full(len(xs), -1)
+    np.maximum.at(last_event, inverse, event_order)
+
+    for k, density, n_nets, is_add in zip(
+        xs.tolist(),
+        np.cumsum(diff_density).tolist(),
+        np.cumsum(diff_n_nets).tolist(),
+        (last_event % 2 == 0).tolist(),
+    ):
+        if n_nets == 0:
             continue
 
-        density = sum([n.width for n in conflict_nets])
-        if command == "add":
+        if is_add:
             if max_density < density:
                 max_density = density
                 start_x = k
@@ -255,21 +280,22 @@ def max_density_zones(oids: list) -> tuple[float, list[Interval]]:
 
 
 def is_desired_net(
-    available_start_x: Decimal, density_zones: Interval, oid: entities.Allocatables
+    available_start_x: COORD, zone_begins: list[COORD], oid: entities.Allocatables
 ) -> bool:
     """最大混雑度がleft edgeの基準点, 配線しようとしているnet.minx]の区間にあるかどうかを返す関数
 
     Args:
-        available_start_x (Decimal): _description_
-        density_zones (Interval): _description_
+        available_start_x (COORD): _description_
+        zone_begins (list[COORD]): 最大混雑度の区間の始点(昇順)
         oid (entities.Allocatables): _description_
 
     Returns:
         bool: _description_
     """
-    for z in density_zones:
-        if available_start_x < z.begin and z.begin < oid.x_interval.begin:
-            return False
+    # 基準点より右にある最初の区間の始点のみを確認すればよい
+    i = bisect.bisect_right(zone_begins, available_start_x)
+    if i < len(zone_begins) and zone_begins[i] < oid.x_interval.begin:
+        return False
     return True
 
 
@@ -305,6 +331,8 @@ def cap(oids: list, ras: list[routing_area.RoutingArea], use_gco=False):
         for c in target_ra.init_ceilings:
             heapq.heappush(height_limit_queue, c)
 
+        # NOTE: 最大混雑度の区間は, 残りのnetが変わった場合のみ再計算する
+        zone_begins = None
         while True:
             # 天井制約線を取得
             if len(height_limit_queue) == 0:
@@ -314,28 +342,33 @@ def cap(oids: list, ras: list[routing_area.RoutingArea], use_gco=False):
 
             oid_is_routed = False
             # left-edgeの基準線
-            x = Decimal(float("-inf"))
+            x = float("-inf")
             # 最大混雑度の区間を取得
-            _, zones = max_density_zones(remaining_oids)
+            if zone_begins is None:
+                _, zones = max_density_zones(remaining_oids)
+                zone_begins = sorted(z.begin for z in zones)
+                x_begins, x_ends = x_bounds(remaining_oids)
             # 天井制約候補リスト
             new_ceiling_heights = []
+            # 配線したnetの位置を記録
+            routed = bytearray(len(remaining_oids))
             while True:
                 is_updated = False
-                for oid in remaining_oids:
-                    if all(
-                        [
-                            x < oid.x_interval.begin,
-                            is_desired_net(x, zones, oid),
-                            target_ra.allocatable(oid, height_limit),
-                        ]
+                for i, oid in enumerate(remaining_oids):
+                    if routed[i]:
+                        continue
+                    if (
+                        x < x_begins[i]
+                        and is_desired_net(x, zone_begins, oid)
+                        and target_ra.allocatable(oid, height_limit)
                     ):
                         # 配線したら天井を登録
                         height = target_ra.allocate(oid, height_limit)
                         new_ceiling_heights.append(height)
                         # left-edgeの基準線を更新
-                        x = oid.x_interval.end
-                        # 配線したnetを削除
-                        remaining_oids.remove(oid)
+                        x = x_ends[i]
+                        # 配線したnetを除外
+                        routed[i] = True
                         is_updated = True
                         oid_is_routed = True
                         break
@@ -343,6 +376,13 @@ def cap(oids: list, ras: list[routing_area.RoutingArea], use_gco=False):
                 if not is_updated:
                     break
 
+            # 配線したnetを削除
+            if oid_is_routed:
+                remaining_oids = [
+                    oid for oid, r in zip(remaining_oids, routed) if not r
+                ]
+                zone_begins = None
+
             # 何も配線できなかった場合
             if not oid_is_routed:
                 if height_limit is None:
@@ -350,7 +390,9 @@ def cap(oids: list, ras: list[routing_area.RoutingArea], use_gco=False):
                     break
                 else:
                     # 現状の天井制約を破棄し, 次にゆるい天井制約で配線を試みる
-                    heapq.heappop(height_limit_queue)
+                    # NOTE: 同じ高さの天井制約では結果が変わらないため, まとめて破棄する
+                    while height_limit_queue and height_limit_queue[0] == height_limit:
+                        heapq.heappop(height_limit_queue)
                     continue
 
             # 天井制約候補へ追加
@@ -360,19 +402,17 @@ def cap(oids: list, ras: list[routing_area.RoutingArea], use_gco=False):
     return routed_ras, remaining_ras, remaining_oids
 
 
-def wirelength_priority(
-    oids: list, gap_heights: list[Decimal], target_gap_height: Decimal
-):
+def wirelength_priority(oids: list, gap_heights: list[COORD], target_gap_height: COORD):
     n_nets = len(oids)
 
-    if len(gap_heights) == 0:
+    if n_nets == 0 or len(gap_heights) == 0:
         return np.zeros((n_nets))
 
     net_heights = np.array([ig.y_mid for ig in oids])
     gap_heights = np.array(gap_heights)
     repeat_gap_heights = np.tile(gap_heights, (n_nets, 1))
     diff = np.abs(repeat_gap_heights.T - np.array(net_heights)).T
-    sorted_args_diff = np.argsort(diff)
+    sorted_args_diff = argsort_distances(diff)
     # 1st, 2ndの距離のgapの高さのindexを取得
     first_close = sorted_args_diff[:, 0]
     if len(gap_heights) == 1:
@@ -381,16 +421,26 @@ def wirelength_priority(
     else:
         second_close = sorted_args_diff[:, 1]
 
-    priorities = []
-    for ig, g1y, g2y in zip(oids, gap_heights[first_close], gap_heights[second_close]):
-        closest_gap_wirelength = min(
-            ig.vertical_wirelength(g1y), ig.vertical_wirelength(g2y)
-        )
-        # print(closest_gap_wirelength)
-        target_gap_wirelength = ig.vertical_wirelength(target_gap_height)
-        # print(target_gap_wirelength)
-        p = closest_gap_wirelength - target_gap_wirelength
-        priorities.append(p)
+    # 全ネットのピンを連結し, ネットごとの垂直配線長を一括で計算する
+    pins_ys = [ig.pins_y for ig in oids]
+    all_pins_y = np.concatenate(pins_ys)
+    n_pins = np.array([len(y) for y in pins_ys])
+    net_index = np.repeat(np.arange(n_nets), n_pins)
+    pin_ends = np.cumsum(n_pins)
+
+    def vertical_wirelengths(heights: np.ndarray) -> np.ndarray:
+        dists = np.abs(all_pins_y - heights[net_index])
+        cum_dists = np.concatenate(([0], np.cumsum(dists)))
+        return cum_dists[pin_ends] - cum_dists[pin_ends - n_pins]
+
+    closest_gap_wirelength = np.minimum(
+        vertical_wirelengths(gap_heights[first_close]),
+        vertical_wirelengths(gap_heights[second_close]),
+    )
+    target_gap_wirelength = vertical_wirelengths(
+        np.full(n_nets, target_gap_height, dtype=np.int64)
+    )
+    priorities = closest_gap_wirelength - target_gap_wirelength
     return priorities
 
 
@@ -407,36 +457,16 @@ def criticality_based_priority(
     Returns:
         list: _description_
     """
-
-    def __critical_wirelength(oid1, oid2) -> int:
-        """
-        Returns:
-        int: -1 if oid1 < oid2; 1 otherwise
-        """
-        # 幅広優先
-        if oid1.width > oid2.width:
-            return -1
-        elif oid1.width < oid2.width:
-            return 1
-
-        # dist-priority: 大きいほうが優先
-        if oid1.dist_priority > oid2.dist_priority:
-            return -1
-        elif oid1.dist_priority < oid2.dist_priority:
-            return 1
-
-        # dist-priorityが一緒の場合, 左優先
-        if oid1.x_interval.begin < oid2.x_interval.begin:
-            return -1
-        else:
-            return 1
-
     gap_heights = [g.y_mid for g in remaining_ras]
     dpriority = wirelength_priority(oids, gap_heights, target_ra.y_mid)
     for oid, p in zip(oids, dpriority):
         oid.dist_priority = p
 
-    return sorted(oids, key=cmp_to_key(__critical_wirelength))
+    # 幅広優先, dist-priorityが大きいほうが優先, dist-priorityが一緒の場合は左優先
+    return sorted(
+        oids,
+        key=lambda oid: (-oid.width, -oid.dist_priority, oid.x_interval.begin),
+    )
 
 
 def prioritize_routing_areas(
@@ -454,20 +484,27 @@ def prioritize_routing_areas(
     else:
         assert remaining_oids is not None, "congestion-based gap selectoin uses oids..."
 
-        # congestion初期化
-        for ra in ras:
-            ra.congestion = 0
-
-        # opt intervalとの重なり調査
-        for oid in remaining_oids:
-            opt_ras = get_optimal_routing_areas(oid, ras)
-            if opt_ras == []:
-                best_ra = get_best_routing_area(oid, ras)
-                opt_ras = [best_ra]
-
-            n_ras = len(opt_ras)
-            for ra in opt_ras:
-                ra.congestion += 1 / n_ras
+        # opt intervalとの重なり調査 (get_optimal_routing_areasを全ネット分まとめて計算)
+        ra_heights = np.array([ra.y_mid for ra in ras])
+        y_mid_lowers = np.array([oid.y_mid_lower for oid in remaining_oids])
+        y_mid_uppers = np.array([oid.y_mid_upper for oid in remaining_oids])
+        is_opt = (y_mid_lowers[:, None] <= ra_heights) & (
+            ra_heights <= y_mid_uppers[:, None]
+        )
+        n_opt_ras = is_opt.sum(axis=1)
+        # 各ネットは最適な配線領域に均等に寄与する
+        weights = is_opt / np.maximum(n_opt_ras, 1)[:, None]
+        for i in np.flatnonzero(n_opt_ras == 0).tolist():
+            best_ra = get_best_routing_area(remaining_oids[i], ras)
+            weights[i, ras.index(best_ra)] = 1
+
+        # congestion計算
+        # NOTE: 加算順序を揃えるため, ネット順の累積和を使う
+        congestions = np.zeros(len(ras))
+        if len(remaining_oids) > 0:
+            congestions = np.cumsum(weights, axis=0)[-1]
+        for ra, c in zip(ras, congestions.tolist()):
+            ra.congestion = c
 
         ras = sorted(ras, reverse=congestion_first, key=lambda x: x.congestion)
 
@@ -513,6 +550,8 @@ def ccap(
             remaining_oids, remaining_ras, target_ra
         )
 
+        # NOTE: 最大混雑度の区間は, 残りのnetが変わった場合のみ再計算する
+        zone_begins = None
         while True:
             # 天井制約線を取得
             if len(height_limit_queue) == 0:
@@ -522,28 +561,33 @@ def ccap(
 
             oid_is_routed = False
             # left-edgeの基準線
-            x = Decimal(float("-inf"))
+            x = float("-inf")
             # 最大混雑度の区間を取得
-            _, zones = max_density_zones(remaining_oids)
+            if zone_begins is None:
+                _, zones = max_density_zones(remaining_oids)
+                zone_begins = sorted(z.begin for z in zones)
+                x_begins, x_ends = x_bounds(remaining_oids)
             # 天井制約候補リスト
             new_ceiling_heights = []
+            # 配線したnetの位置を記録
+            routed = bytearray(len(remaining_oids))
             while True:
                 is_updated = False
-                for oid in remaining_oids:
-                    if all(
-                        [
-                            x < oid.x_interval.begin,
-                            is_desired_net(x, zones, oid),
-                            target_ra.allocatable(oid, height_limit),
-                        ]
+                for i, oid in enumerate(remaining_oids):
+                    if routed[i]:
+                        continue
+                    if (
+                        x < x_begins[i]
+                        and is_desired_net(x, zone_begins, oid)
+                        and target_ra.allocatable(oid, height_limit)
                     ):
                         # 配線したら天井を登録
                         height = target_ra.allocate(oid, height_limit)
                         new_ceiling_heights.append(height)
                         # left-edgeの基準線を更新
-                        x = oid.x_interval.end
-                        # 配線したnetを削除
-                        remaining_oids.remove(oid)
+                        x = x_ends[i]
+                        # 配線したnetを除外
+                        routed[i] = True
                         is_updated = True
                         oid_is_routed = True
                         break
@@ -551,6 +595,13 @@ def ccap(
                 if not is_updated:
                     break
 
+            # 配線したnetを削除
+            if oid_is_routed:
+                remaining_oids = [
+                    oid for oid, r in zip(remaining_oids, routed) if not r
+                ]
+                zone_begins = None
+
             # 何も配線できなかった場合
             if not oid_is_routed:
                 if height_limit is None:
@@ -558,7 +609,9 @@ def ccap(
                     break
                 else:
                     # 現状の天井制約を破棄し, 次にゆるい天井制約で配線を試みる
-                    heapq.heappop(height_limit_queue)
+                    # NOTE: 同じ高さの天井制約では結果が変わらないため, まとめて破棄する
+                    while height_limit_queue and height_limit_queue[0] == height_limit:
+                        heapq.heappop(height_limit_queue)
                     continue
 
             # 天井制約候補へ追加
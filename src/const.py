@@ -1,71 +1,106 @@
-from decimal import Decimal
 from intervaltree import Interval
 from gcr import entities, containers, routing_area
+from gcr.entities import COORD, to_coord
 
 
 class ProblemSettings:
+    __slots__ = (
+        "reserved_areas_file",
+        "_reserved_areas",
+        "algorithm_name",
+        "use_gco",
+        "use_parallel",
+        "target_layer",
+        "save_dir",
+        "output_format",
+        "n_gaps",
+        "n_subchannels",
+        "interval",
+        "y_bottom_blockage",
+        "avoid_points",
+        "blockage_x_intervals",
+        "blockage_x_begins",
+        "subchannel_x_intervals",
+        "gap_width_dict",
+        "shield_width_dict",
+        "subchannel_width_dict",
+        "fix_net_group_dict",
+        "shield_width",
+        "gap_width",
+        "gap_interval",
+        "num_subchannel_cols",
+        "subchannel_width",
+        "subchannel_interval",
+    )
 
     def __init__(self, pb: dict, args: dict):
         # file paths
         self.reserved_areas_file = args.reserved_areas
+        # NOTE: 予約領域は列ごとに参照されるため, 初回読み込み時の結果を使い回す
+        self._reserved_areas = None
         self.algorithm_name = args.algorithm
         self.use_gco = args.gco
+        self.use_parallel = not args.no_parallel
 
         # load arguments
         self.target_layer = args.layer
         self.save_dir = args.save_dir
+        self.output_format = args.output_format
 
         # load common parameters
         self.n_gaps = pb["num_gaps"]
         self.n_subchannels = pb["num_subchannels"]
-        self.interval = pb["gap_y_interval"]
-        self.y_bottom_blockage = pb["y_bottom_blockage"]
+        self.interval = to_coord(pb["gap_y_interval"])
+        self.y_bottom_blockage = to_coord(pb["y_bottom_blockage"])
 
         self.avoid_points = {}
         for k, v in pb["avoid_points"].items():
-            self.avoid_points[k] = entities.Pin(v["x"], v["y"])
+            self.avoid_points[k] = entities.Pin(to_coord(v["x"]), to_coord(v["y"]))
 
         self.blockage_x_intervals = []
         for v in pb["blockage_x_intervals"]:
-            self.blockage_x_intervals.append(Interval(v["x_min"], v["x_max"]))
+            self.blockage_x_intervals.append(
+                Interval(to_coord(v["x_min"]), to_coord(v["x_max"]))
+            )
         self.blockage_x_intervals = sorted(
             self.blockage_x_intervals, key=lambda x: x.begin
         )
+        self.blockage_x_begins = [iv.begin for iv in self.blockage_x_intervals]
 
         self.subchannel_x_intervals = []
         for v in pb["subchannel_x_intervals"]:
-            self.subchannel_x_intervals.append(Interval(v["x_min"], v["x_max"]))
+            self.subchannel_x_intervals.append(
+                Interval(to_coord(v["x_min"]), to_coord(v["x_max"]))
+            )
         self.subchannel_x_intervals = sorted(
             self.subchannel_x_intervals, key=lambda x: x.begin
         )
 
         # layer independent parameters
-        self.gap_width_dict = pb["gap_width"]
-        self.shield_width_dict = pb["shield_width"]
-        self.subchannel_width_dict = pb["subchannel_width"]
+        self.gap_width_dict = self.__to_coord_dict(pb["gap_width"])
+        self.shield_width_dict = self.__to_coord_dict(pb["shield_width"])
+        self.subchannel_width_dict = self.__to_coord_dict(pb["subchannel_width"])
 
         # fixed net info
         # NOTE: fix_net_group_dict[net_group_name][property_name] = fixed_parameter
-        self.fix_net_group_dict = pb["fix_net_group"]
+        self.fix_net_group_dict = {
+            net_group_name: self.__to_coord_dict(params)
+            for net_group_name, params in pb["fix_net_group"].items()
+        }
 
-    @property
-    def shield_width(self) -> Decimal:
-        return self.shield_width_dict[self.target_layer]
+        # NOTE: 対象層は固定のため, 層に依存するパラメータは一度だけ求めておく
+        self.shield_width: COORD = self.shield_width_dict[self.target_layer]
+        self.gap_width: COORD = self.gap_width_dict[self.target_layer]
+        self.gap_interval: COORD = self.interval - self.gap_width
+        self.num_subchannel_cols: int = len(self.subchannel_x_intervals)
+        self.subchannel_width: COORD = self.subchannel_width_dict[self.target_layer]
+        self.subchannel_interval: COORD = self.interval
 
-    @property
-    def gap_width(self) -> dict:
-        return self.gap_width_dict[self.target_layer]
+    def __to_coord_dict(self, d: dict) -> dict:
+        return {k: to_coord(v) for k, v in d.items()}
 
-    @property
-    def gap_interval(self) -> Decimal:
-        return self.interval - self.gap_width_dict[self.target_layer]
-
-    def gap_height(self, i: int) -> Decimal:
-        return (
-            self.y_bottom_blockage
-            + Decimal(i + 1) * self.gap_interval
-            + i * self.gap_width
-        )
+    def gap_height(self, i: int) -> COORD:
+        return self.y_bottom_blockage + (i + 1) * self.gap_interval + i * self.gap_width
 
     def generate_gap(self) -> routing_area.RoutingArea:
         return routing_area.RoutingArea(width=self.gap_width)
@@ -77,20 +112,8 @@ class ProblemSettings:
             gaps.append(g)
         return gaps
 
-    @property
-    def num_subchannel_cols(self) -> int:
-        return len(self.subchannel_x_intervals)
-
-    @property
-    def subchannel_width(self) -> Decimal:
-        return self.subchannel_width_dict[self.target_layer]
-
-    @property
-    def subchannel_interval(self) -> Decimal:
-        return self.interval
-
-    def subchannel_height(self, i: int) -> Decimal:
-        return self.y_bottom_blockage + Decimal(i) * self.subchannel_interval
+    def subchannel_height(self, i: int) -> COORD:
+        return self.y_bottom_blockage + i * self.subchannel_interval
 
     def generate_subchannel(self) -> routing_area.RoutingArea:
         return routing_area.RoutingArea(width=self.subchannel_width)
@@ -117,17 +140,61 @@ class ProblemSettings:
         import csv
         from gcr.entities import ReservedArea
 
+        if self._reserved_areas is not None:
+            return self._reserved_areas
+
         # read from file...
-        reserved_areas = []
+        # NOTE: 全行をまとめて読み込み, 対象層の行のみを変換する.
+        # 対象層以外の行は, 先頭の層名で判定してcsvの字句解析を省く
+        layer_prefix = f"{self.target_layer},"
         with open(self.reserved_areas_file, encoding="utf-8-sig") as f:
-            reader = csv.reader(f)
-            for row in reader:
-                # row: list[str]
-                layer = row[0]
-                if layer != self.target_layer:
-                    continue
-
-                x_min, y_min, x_max, y_max = map(Decimal, row[1:])
-                ra = ReservedArea(Interval(x_min, x_max), Interval(y_min, y_max))
-                reserved_areas.append(ra)
+            lines = [line for line in f if line.startswith(layer_prefix)]
+        reserved_areas = [
+            ReservedArea(
+                Interval(to_coord(x_min), to_coord(x_max)),
+                Interval(to_coord(y_min), to_coord(y_max)),
+            )
+            for _, x_min, y_min, x_max, y_max in csv.reader(lines)
+        ]
+        self._reserved_areas = reserved_areas
         return reserved_areas
+
+    def compute_all_blockages(self) -> list[list[list[entities.Blockage]]]:
+        """予約領域から, 全列のsubchannelに配置する障害物を一度に求める
+
+        Returns:
+            list[list[list[entities.Blockage]]]: blockages[col][i] = 障害物のリスト
+        """
+        reserved_areas = self.read_reserved_areas()
+        # 列のx区間を索引化し, 各予約領域と重なる列のみを取り出す
+        col_index = routing_area.SortedIntervalIndex()
+        for col, iv in enumerate(self.subchannel_x_intervals):
+            col_index.add(Interval(iv.begin, iv.end, col))
+        y_bottom = self.y_bottom_blockage
+        interval = self.subchannel_interval
+        width = self.subchannel_width
+
+        blockages = [
+            [[] for _ in range(self.n_subchannels)]
+            for _ in range(self.num_subchannel_cols)
+        ]
+        for ra in reserved_areas:
+            ra_x_begin, ra_x_end = ra.x_interval.begin, ra.x_interval.end
+            ra_y_begin, ra_y_end = ra.y_interval.begin, ra.y_interval.end
+            # y軸で重なるsubchannel: height < ra_y_end かつ ra_y_begin < height + width
+            i_begin = max((ra_y_begin - y_bottom - width) // interval + 1, 0)
+            i_end = min(-((y_bottom - ra_y_end) // interval), self.n_subchannels)
+            for col in col_index.overlap(ra_x_begin, ra_x_end):
+                col_x_interval = self.subchannel_x_intervals[col]
+                x_min = max(col_x_interval.begin, ra_x_begin)
+                x_max = min(col_x_interval.end, ra_x_end)
+                for i in range(i_begin, i_end):
+                    height = y_bottom + i * interval
+                    b = entities.Blockage(
+                        x_min,
+                        x_max,
+                        max(height, ra_y_begin) - height,
+                        min(height + width, ra_y_end) - height,
+                    )
+                    blockages[col][i].append(b)
+        return blockages
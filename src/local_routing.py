@@ -1,9 +1,18 @@
-from decimal import Decimal
-from intervaltree import Interval
+import io
+import os
+import bisect
+import contextlib
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
 from collections import defaultdict
 from gcr import entities, utils
+from gcr.entities import COORD
 from src import algorithms, preprocessing
 
+# NOTE: プロセスの起動と列データの受け渡しに数十msかかるため,
+# 局所配線するネットがこの数未満の場合は並列化せずに順に配線する
+PARALLEL_MIN_NETS = 1000
+
 
 def divide_nets_by_block(
     net_group_dict: dict, problem_settings: dict
@@ -21,82 +30,30 @@ def divide_nets_by_block(
     col2ent_group_dict = defaultdict(dict)
     # それぞれのcolに配線するネット数
     n_nets_in_areas = defaultdict(int)
+    blockage_x_begins = problem_settings.blockage_x_begins
     for net_name, nl in net_group_dict.items():
-        divided_nl = defaultdict(list)
-        for n in nl:
-            assign = False
-            for i, bzone in enumerate(problem_settings.blockage_x_intervals):
-                if n.x_interval.end < bzone.begin:
-                    divided_nl[i].append(n)
-                    assign = True
-                    break
-
-            if not assign:
-                divided_nl[len(problem_settings.blockage_x_intervals)].append(n)
-
-        assert len(divided_nl) == 1, "Different target area in the same group..."
+        # NOTE: 右端より左端が大きい最初のblockageの番号. なければ最後の列
+        col_no = bisect.bisect_right(blockage_x_begins, nl[0].x_interval.end)
+        assert all(
+            bisect.bisect_right(blockage_x_begins, n.x_interval.end) == col_no
+            for n in nl[1:]
+        ), "Different target area in the same group..."
 
-        col_no = list(divided_nl.keys())[0]
         n_nets_in_areas[col_no] += len(nl)
         # 保存
         col2ent_group_dict[col_no][net_name] = nl
     return col2ent_group_dict
 
 
-def read_blockages(problem_settings: dict, col: int) -> dict:
-    # allocate blockages
-    reserved_areas = problem_settings.read_reserved_areas()
-
-    blockages = defaultdict(lambda: defaultdict(list))
-    for i in range(problem_settings.n_subchannels):
-        height = (
-            problem_settings.y_bottom_blockage
-            + i * problem_settings.subchannel_interval
-        )
-        subgap_y_interval = Interval(height, height + problem_settings.subchannel_width)
-        for ra in reserved_areas:
-            overlapped_x_interval_size = problem_settings.subchannel_x_intervals[
-                col
-            ].overlap_size(ra.x_interval)
-            overlapped_y_interval_size = subgap_y_interval.overlap_size(ra.y_interval)
-
-            if overlapped_x_interval_size > 0 and overlapped_y_interval_size > 0:
-                block_x_interval = Interval(
-                    max(
-                        problem_settings.subchannel_x_intervals[col].begin,
-                        ra.x_interval.begin,
-                    ),
-                    min(
-                        problem_settings.subchannel_x_intervals[col].end,
-                        ra.x_interval.end,
-                    ),
-                )
-                block_y_interval = Interval(
-                    max(subgap_y_interval.begin, ra.y_interval.begin)
-                    - subgap_y_interval.begin,
-                    min(subgap_y_interval.end, ra.y_interval.end)
-                    - subgap_y_interval.begin,
-                )
-                b = entities.Blockage(
-                    block_x_interval.begin,
-                    block_x_interval.end,
-                    block_y_interval.begin,
-                    block_y_interval.end,
-                )
-                blockages[col][i].append(b)
-
-    return blockages
-
-
 def get_unallocatable_net_dict_after_divisoin(
-    net_group_dict: dict, target_area_width: Decimal, shield_width: Decimal
+    net_group_dict: dict, target_area_width: COORD, shield_width: COORD
 ) -> dict[str, list[entities.Net]]:
     """対象配線領域に対し, ネットを分割しても配線できないネットを返す
 
     Args:
         net_group_dict (dict): _description_
-        target_area_width (Decimal): _description_
-        shield_width (Decimal): _description_
+        target_area_width (COORD): _description_
+        shield_width (COORD): _description_
 
     Returns:
         dict[str, list[entities.Net]]: _description_
@@ -119,49 +76,38 @@ def get_unallocatable_net_dict_after_divisoin(
     return unallocatable_net_dict
 
 
-def run(net_group_dict: dict, problem_settings: dict) -> dict:
-    """net_group_dict: local配線すべきnetのみの情報"""
-
-    # 配線できなかったネットを格納する
-    unallocatable_net_group_dict = defaultdict(list)
+@contextlib.contextmanager
+def print_log_on_error(log: io.StringIO):
+    """例外が送出された場合に, それまでに捕捉した出力を表示してから送出し直す
 
-    # NOTE:sub-channelにそもそも分割しても配線できなものは,予め省いておく
-    remove_net_dict = get_unallocatable_net_dict_after_divisoin(
-        net_group_dict,
-        problem_settings.subchannel_width,
-        problem_settings.shield_width,
-    )
-    for net_name, nl in remove_net_dict.items():
-        assert (
-            not net_name in unallocatable_net_group_dict
-        ), "Net Name Duplication Error"
-        unallocatable_net_group_dict[net_name] = nl
-        # 入力から削除
-        if net_name in net_group_dict:
-            del net_group_dict[net_name]
+    Args:
+        log (io.StringIO): 捕捉した標準出力
+    """
+    try:
+        yield
+    except BaseException:
+        print(log.getvalue(), end="", flush=True)
+        raise
 
-    # col毎にnetlistを分ける -> divided_nl_dict_dict[col][name] = nl
-    net_group_dict_by_block = divide_nets_by_block(net_group_dict, problem_settings)
 
-    # subchannelを生成
-    subchannel_dict = {}
-    for col in range(problem_settings.num_subchannel_cols):
-        # suchannel初期化
-        subchannels = problem_settings.generate_subchannels()
-        # allocate blockages
-        blockages = read_blockages(problem_settings, col)
-        for i, subchannel in enumerate(subchannels):
-            for b in blockages[col][i]:
-                subchannel.allocate(b)
-        subchannel_dict[col] = subchannels
+def route_column(
+    col: int, subchannels: list, net_group_dict: dict, problem_settings: dict
+) -> tuple[list, dict, str]:
+    """1列分のsubchannelに配線する
 
-    ##################################
-    # Routing by block
-    ##################################
-    for col in range(problem_settings.num_subchannel_cols):
-        subchannels: list = subchannel_dict[col]
-        net_group_dict: dict[str, list] = net_group_dict_by_block[col]
+    Args:
+        col (int): 列番号
+        subchannels (list): 障害物を配置済みの対象列のsubchannel
+        net_group_dict (dict): 対象列に配線するネット
+        problem_settings (dict): 問題設定クラス
 
+    Returns:
+        tuple[list, dict, str]: 配線後のsubchannel, 配線できなかったネット, 標準出力の内容
+    """
+    unallocatable_net_group_dict = {}
+    # NOTE: 並列実行時も列の順に表示できるよう, 出力は呼び出し元に返す
+    log = io.StringIO()
+    with print_log_on_error(log), contextlib.redirect_stdout(log):
         # 束配線と配線へ分ける
         subchannel = problem_settings.generate_subchannel()
         oids, bundles = preprocessing.run(net_group_dict, problem_settings, subchannel)
@@ -200,11 +146,84 @@ def run(net_group_dict: dict, problem_settings: dict) -> dict:
                 unallocatable_net_group_dict[oid.name] = net_group_dict[oid.name]
 
         total_subchannels = used_subchannels + remaining_subchannels
-        subchannel_dict[col] = total_subchannels
         n_subchannels_used_for_total = utils.get_n_routing_areas_used(total_subchannels)
 
         print("Routing Summary")
         print(f"#subchannels used for bundles: {n_subchannels_used_for_bundles}")
         print(f"#subchannels used for total: {n_subchannels_used_for_total}")
 
+    return total_subchannels, unallocatable_net_group_dict, log.getvalue()
+
+
+def run(net_group_dict: dict, problem_settings: dict) -> dict:
+    """net_group_dict: local配線すべきnetのみの情報"""
+
+    # 配線できなかったネットを格納する
+    unallocatable_net_group_dict = defaultdict(list)
+
+    # NOTE:sub-channelにそもそも分割しても配線できなものは,予め省いておく
+    remove_net_dict = get_unallocatable_net_dict_after_divisoin(
+        net_group_dict,
+        problem_settings.subchannel_width,
+        problem_settings.shield_width,
+    )
+    for net_name, nl in remove_net_dict.items():
+        assert (
+            not net_name in unallocatable_net_group_dict
+        ), "Net Name Duplication Error"
+        unallocatable_net_group_dict[net_name] = nl
+        # 入力から削除
+        if net_name in net_group_dict:
+            del net_group_dict[net_name]
+
+    # col毎にnetlistを分ける -> divided_nl_dict_dict[col][name] = nl
+    net_group_dict_by_block = divide_nets_by_block(net_group_dict, problem_settings)
+
+    # subchannelを生成
+    subchannel_dict = {}
+    # NOTE: 全列の障害物は予約領域を一度走査して求める
+    blockages = problem_settings.compute_all_blockages()
+    for col in range(problem_settings.num_subchannel_cols):
+        # suchannel初期化
+        subchannels = problem_settings.generate_subchannels()
+        # allocate blockages
+        for subchannel, subchannel_blockages in zip(subchannels, blockages[col]):
+            for b in subchannel_blockages:
+                subchannel.allocate(b)
+        subchannel_dict[col] = subchannels
+
+    ##################################
+    # Routing by block
+    ##################################
+    # NOTE: 列ごとの配線は互いに独立なため, プロセスを分けて並列に実行する.
+    # ネット数が少ない場合や並列化しない設定の場合は順に配線する
+    n_cols = problem_settings.num_subchannel_cols
+    cols = range(n_cols)
+    subchannels_by_col = [subchannel_dict[col] for col in cols]
+    net_group_dicts_by_col = [net_group_dict_by_block[col] for col in cols]
+    n_workers = min(os.cpu_count() or 1, n_cols)
+    n_nets = sum(len(nl) for d in net_group_dicts_by_col for nl in d.values())
+    use_pool = (
+        problem_settings.use_parallel and n_workers > 1 and n_nets >= PARALLEL_MIN_NETS
+    )
+    with contextlib.ExitStack() as stack:
+        if use_pool:
+            executor = stack.enter_context(ProcessPoolExecutor(max_workers=n_workers))
+            map_func = executor.map
+        else:
+            map_func = map
+        results = map_func(
+            route_column,
+            cols,
+            subchannels_by_col,
+            net_group_dicts_by_col,
+            repeat(problem_settings),
+        )
+
+        # 列の順に結果をまとめる. 出力は列の結果が揃い次第表示する
+        for col, (total_subchannels, unallocatables, log) in zip(cols, results):
+            print(log, end="")
+            subchannel_dict[col] = total_subchannels
+            unallocatable_net_group_dict.update(unallocatables)
+
     return subchannel_dict, unallocatable_net_group_dict
@@ -1,6 +1,7 @@
 import os
 import time
 import argparse
+import numpy as np
 from intervaltree import Interval
 from gcr import entities, utils
 from src import local_routing, global_routing, const
@@ -17,23 +18,24 @@ def remove_not_assumed_netlist(net_group_dict: dict, problem_settings: dict) ->
         net_group_dict (dict): 要素が削除されたnet_group_dict
     """
     # 先に配線対象層以外を削除
-    remove_net_group_name = []
+    remove_net_group_name = set()
     for net_group_name, nl in net_group_dict.items():
         if not nl[0].layer == problem_settings.target_layer:
-            remove_net_group_name.append(net_group_name)
+            remove_net_group_name.add(net_group_name)
 
-    for net_group_name in set(remove_net_group_name):
+    for net_group_name in remove_net_group_name:
         del net_group_dict[net_group_name]
 
-    remove_net_group_name = []
+    remove_net_group_name = set()
     for net_group_name, nl in net_group_dict.items():
         # 同じgroupで配線層が異なる
-        if len(set([n.layer for n in nl])) != 1:
-            remove_net_group_name.append(net_group_name)
+        first = nl[0].layer
+        if any(n.layer != first for n in nl[1:]):
+            remove_net_group_name.add(net_group_name)
 
     print("=" * 30)
     print("Remove net group due to not-compatible design rules: ")
-    for net_group_name in set(remove_net_group_name):
+    for net_group_name in remove_net_group_name:
         print(f"- {net_group_name}")
         del net_group_dict[net_group_name]
     print("=" * 30)
@@ -52,22 +54,29 @@ def divide_nets_into_local_or_global(
     Returns:
         tuple[dict, dict]: _description_
     """
-
-    def overlap_blockage_x_interval(
-        net: entities.Net, blockages_x_intervals: list[Interval]
-    ) -> bool:
-        for block_x_interval in blockages_x_intervals:
-            if net.x_interval.overlaps(block_x_interval):
-                return True
-        return False
+    # blockageの区間を(B, 2)の配列にまとめ, ネットとの重なりを一括で判定する
+    block_bounds = np.array(
+        [(iv.begin, iv.end) for iv in blockages_x_intervals], dtype=np.int64
+    ).reshape(-1, 2)
+    block_begins = block_bounds[:, 0]
+    block_ends = block_bounds[:, 1]
 
     global_net_group_dict = {}
     local_net_group_dict = {}
     for net_group_name, nl in net_group_dict.items():
+        n_nets = len(nl)
+        begins = np.fromiter(
+            (n.x_interval.begin for n in nl), dtype=np.int64, count=n_nets
+        )
+        ends = np.fromiter((n.x_interval.end for n in nl), dtype=np.int64, count=n_nets)
+        overlaps_any = (
+            (begins[:, None] < block_ends) & (block_begins < ends[:, None])
+        ).any(axis=1)
+
         global_nl = []
         local_nl = []
-        for n in nl:
-            if overlap_blockage_x_interval(n, blockages_x_intervals):
+        for n, overlaps in zip(nl, overlaps_any):
+            if overlaps:
                 global_nl.append(n)
             else:
                 local_nl.append(n)
@@ -132,10 +141,10 @@ def two_step_routing(netlist_dict: dict, problem_settings: dict) -> None:
     # 配線長
     print("Wirelength")
     twl = utils.total_vertical_wirelength(gaps)
-    print(f"- gaps: {twl}")
+    print(f"- gaps: {entities.to_decimal(twl)}")
     for col, subc in subchannels.items():
         twl = utils.total_vertical_wirelength(subc)
-        print(f"- subchannels-col{col}: {twl}")
+        print(f"- subchannels-col{col}: {entities.to_decimal(twl)}")
     print("=" * 50)
 
     # save routing result...
@@ -143,7 +152,8 @@ def two_step_routing(netlist_dict: dict, problem_settings: dict) -> None:
         prefix = f"{problem_settings.algorithm_name}_gco"
     else:
         prefix = f"{problem_settings.algorithm_name}"
-    fname = prefix + f"_layer{problem_settings.target_layer}.json"
+    ext = problem_settings.output_format
+    fname = prefix + f"_layer{problem_settings.target_layer}.{ext}"
     utils.RoutingResultSerializer(problem_settings).serialize(
         fname, gaps=gaps, subchannels=subchannels
     )
@@ -189,12 +199,25 @@ def get_args():
         action="store_true",
         help="Whether to use GCO or not",
     )
+    parser.add_argument(
+        "--no_parallel",
+        default=False,
+        action="store_true",
+        help="Route subchannel columns one by one without worker processes",
+    )
     parser.add_argument(
         "--save_dir",
         "-sd",
         default="assets/output/",
         help="Save directory",
     )
+    parser.add_argument(
+        "--output_format",
+        "-of",
+        choices=["json", "msgpack"],
+        default="json",
+        help="Routing result file format. msgpack requires the msgpack extra",
+    )
     args = parser.parse_args()
     return args
 
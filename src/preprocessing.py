@@ -1,8 +1,8 @@
-from decimal import Decimal
 from gcr import containers, entities
+from gcr.entities import COORD
 
 
-def divide_width(w: Decimal, factor: Decimal) -> list[Decimal]:
+def divide_width(w: COORD, factor: COORD) -> list[COORD]:
     """複数のnetに分割するときに, 各netの幅を決定する
     w=8, factor=3
     [3, 3, 2]
@@ -10,15 +10,14 @@ def divide_width(w: Decimal, factor: Decimal) -> list[Decimal]:
     [2, 2, 2, 2]
 
     Args:
-        w (Decimal): トランクの幅
-        factor (Decimal): 分割数
+        w (COORD): トランクの幅
+        factor (COORD): 分割数
 
     Returns:
-        list[Decimal]: 分割後の幅のリスト
+        list[COORD]: 分割後の幅のリスト
     """
-    quotient = int(w // factor)
-    remainder = w % factor
-    if remainder == Decimal("0.0"):
+    quotient, remainder = divmod(w, factor)
+    if remainder == 0:
         remainders = []
     else:
         remainders = [remainder]
@@ -26,14 +25,14 @@ def divide_width(w: Decimal, factor: Decimal) -> list[Decimal]:
 
 
 def trunk_division(
-    net: entities.Net, shield_width: Decimal, routing_area_width: Decimal
+    net: entities.Net, shield_width: COORD, routing_area_width: COORD
 ) -> list[entities.Net]:
     """対象配線領域の幅に応じてトランクを分割する
 
     Args:
         net (entities.Net): 分割するネット
-        shield_width (Decimal): シールド線の幅
-        routing_area_width (Decimal): 対象配線領域の幅
+        shield_width (COORD): シールド線の幅
+        routing_area_width (COORD): 対象配線領域の幅
 
     Raises:
         ValueError: 配線できるように分割できない場合
@@ -54,18 +53,21 @@ def trunk_division(
     # 分割後の幅を決定する
     divided_widths = divide_width(net.width, allocatable_width_max)
     # 分割後のネットリストを生成する
-    new_nl = []
-    for i, width in enumerate(divided_widths):
-        new_net = entities.Net(
+    # NOTE: ピンは元のネットと共通のため, x区間も再計算せずに引き継ぐ
+    new_nl = [
+        entities.Net(
             name=f"{net.name}_c{i}",
             layer=net.layer,
             width=width,
             space=net.upper_space,
+            x_min=net.x_min,
+            x_max=net.x_max,
             pins=net.pins,
             shield_type=net.shield_type,
             group_no=net.group_no,
         )
-        new_nl.append(new_net)
+        for i, width in enumerate(divided_widths)
+    ]
     return new_nl
 
 
@@ -84,9 +86,11 @@ def grouping(
     """
     groups = []
     tmp_nl = []
+    # NOTE: ネットを一つずつ追加し, 毎回の再構築を避ける
+    ig = problem_settings.generate_overlapped_interval_dict([])
     for n in netlist:
         tmp_nl.append(n)
-        ig = problem_settings.generate_overlapped_interval_dict(tmp_nl)
+        ig.add(n)
         if not routing_area.allocatable(ig):
             if len(tmp_nl) == 1:
                 # NOTE: 束netの要素の一つだが, 単体で対象配線領域に配線不可能 -> 分割
@@ -97,6 +101,7 @@ def grouping(
             else:
                 groups.append(tmp_nl[:-1])
                 tmp_nl = tmp_nl[-1:]
+                ig = problem_settings.generate_overlapped_interval_dict(tmp_nl)
 
     if tmp_nl != []:
         groups.append(tmp_nl)